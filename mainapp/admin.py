@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Category, Product, Cart, CartItem, Order, OrderItem, Coupon, ProductRating, Newsletter, ProductReview, ReviewImage, ReviewHelpful, UserProfile, UserProduct, Conversation, Message, TelebirrPayment, ProductImage
+from .models import CustomUser, Category, Product, Cart, CartItem, Order, OrderItem, Coupon, ProductRating, Newsletter, ProductReview, ReviewImage, ReviewHelpful, UserProfile, UserProduct, Conversation, Message, TelebirrPayment, ProductImage, DailySalesRollup, PaymentNotification
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -33,6 +33,7 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name', 'description')
     date_hierarchy = 'created_at'
+    readonly_fields = Product.RATING_FIELDS
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -40,7 +41,8 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'updated_at')
+    list_display = ('user', 'item_count', 'subtotal', 'discount', 'created_at', 'updated_at')
+    readonly_fields = ('item_count', 'subtotal', 'discount')
     inlines = [CartItemInline]
 
 class OrderItemInline(admin.TabularInline):
@@ -55,6 +57,20 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemInline]
     date_hierarchy = 'created_at'
 
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'product', 'category', 'units', 'gross', 'discount', 'order_count')
+    list_filter = ('category',)
+    date_hierarchy = 'date'
+    readonly_fields = ('date', 'product', 'category', 'units', 'gross', 'discount', 'order_count')
+
+@admin.register(PaymentNotification)
+class PaymentNotificationAdmin(admin.ModelAdmin):
+    list_display = ('out_trade_no', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status',)
+    search_fields = ('out_trade_no',)
+    readonly_fields = ('payload', 'attempts', 'last_error', 'received_at', 'processed_at')
+
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
     list_display = ('code', 'valid_from', 'valid_to', 'discount', 'active')
@@ -0,0 +1,192 @@
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import urljoin, urlsplit
+import requests
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.templatetags.static import static
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Third-party files served from our own static/ instead of four CDNs:
+# path under static/ -> pinned upstream URL
+VENDOR_ASSETS = {
+    'vendor/bootstrap/css/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/js/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
+    'vendor/inter/inter.css': 'https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap',
+    'vendor/jquery/jquery.min.js': 'https://code.jquery.com/jquery-3.6.0.min.js',
+    'vendor/chartjs/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+}
+
+# Google Fonts picks the font format from the User-Agent; ask for woff2
+FETCH_HEADERS = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'}
+FETCH_TIMEOUT = (3.05, 30)
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)(?!data:)([^'")]+)\1\s*\)''')
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ttf', '.eot', '.otf'}
+COMPRESS_MIN_SIZE = 256
+# Fingerprinted names never change content, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=300'
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def vendor_assets(static_dir, refresh=False, session=None):
+    """
+    Download VENDOR_ASSETS into ``static_dir``.
+
+    Stylesheets are rewritten so the fonts and images they reference are
+    downloaded next to them and loaded from our host too. Files already on
+    disk are kept unless ``refresh`` is set. Returns the paths written.
+    """
+    session = session or requests.Session()
+    written = []
+    for path, url in VENDOR_ASSETS.items():
+        target = os.path.join(static_dir, *path.split('/'))
+        if os.path.exists(target) and not refresh:
+            continue
+        content = _fetch(session, url)
+        if path.endswith('.css'):
+            content = _localize_css(session, content.decode(), url, os.path.dirname(target)).encode()
+        _write(target, content)
+        written.append(path)
+    return written
+
+
+def _fetch(session, url):
+    response = session.get(url, headers=FETCH_HEADERS, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def _write(target, content):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(content)
+
+
+def _localize_css(session, css, base_url, css_dir):
+    downloaded = {}
+
+    def replace(match):
+        url = urljoin(base_url, match.group(2).strip())
+        if url not in downloaded:
+            name = posixpath.basename(urlsplit(url).path)
+            _write(os.path.join(css_dir, 'fonts', name), _fetch(session, url))
+            downloaded[url] = f'fonts/{name}'
+        return f'url({downloaded[url]})'
+
+    return CSS_URL_RE.sub(replace, css)
+
+
+def compress_file(path):
+    """
+    Write ``.gz`` (and ``.br`` when brotli is installed) next to ``path``.
+
+    Skips binary formats that are already compressed and any output that
+    would not be smaller than the original. Returns the files written.
+    """
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return []
+    with open(path, 'rb') as f:
+        content = f.read()
+    if len(content) < COMPRESS_MIN_SIZE:
+        return []
+
+    compressed = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        compressed['.br'] = brotli.compress(content, quality=11)
+
+    written = []
+    for suffix, data in compressed.items():
+        if len(data) < len(content):
+            with open(path + suffix, 'wb') as f:
+                f.write(data)
+            written.append(path + suffix)
+    return written
+
+
+# Resolved URLs; CDN fallbacks are never stored, so a vendored file is
+# picked up as soon as build_assets has written it
+_asset_urls = {}
+
+
+def asset_url(path):
+    """
+    URL for a static asset.
+
+    A vendored file that has not been downloaded yet is an error unless
+    VENDOR_ASSET_CDN_FALLBACK allows linking its upstream CDN URL instead
+    (the DEBUG default).
+    """
+    url = _asset_urls.get(path)
+    if url is None:
+        if path in VENDOR_ASSETS and not vendored_asset_exists(path):
+            if not settings.VENDOR_ASSET_CDN_FALLBACK:
+                raise ImproperlyConfigured(f"{path} has not been vendored; run `python manage.py build_assets`")
+            return VENDOR_ASSETS[path]
+        url = _asset_urls[path] = static(path)
+    return url
+
+
+def clear_asset_urls():
+    _asset_urls.clear()
+
+
+def vendored_asset_exists(path):
+    return bool(finders.find(path) or staticfiles_storage.exists(path))
+
+
+def missing_vendor_assets():
+    return [path for path in VENDOR_ASSETS if not vendored_asset_exists(path)]
+
+
+def _is_fingerprinted(path):
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    return path in hashed_files.values()
+
+
+def serve_asset(request, path):
+    """
+    Serve a collected static file from STATIC_ROOT.
+
+    Sends the precompressed ``.br``/``.gz`` sibling the client accepts and
+    marks fingerprinted files immutable with a one-year max-age.
+    """
+    try:
+        fullpath = safe_join(staticfiles_storage.location, path)
+    except ValueError:
+        raise Http404(path)
+    if not os.path.isfile(fullpath):
+        raise Http404(path)
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if re.search(rf'\b{name}\b', accepted) and os.path.isfile(fullpath + suffix):
+            encoding, fullpath = name, fullpath + suffix
+            break
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = FileResponse(open(fullpath, 'rb'), content_type=content_type, filename=posixpath.basename(path))
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if _is_fingerprinted(path) else DEFAULT_CACHE_CONTROL
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,52 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import translation
+
+CATALOG_CACHE_ALIAS = 'catalog'
+VERSION_KEY = 'catalog:version'
+# Context variable holding the images a catalog fragment rendered without
+# variants; see templatetags.catalog_cache and templatetags.images
+PENDING_IMAGES_KEY = 'catalog_fragment_pending_images'
+
+
+def get_catalog_cache():
+    alias = CATALOG_CACHE_ALIAS if CATALOG_CACHE_ALIAS in settings.CACHES else 'default'
+    return caches[alias]
+
+
+def get_catalog_version():
+    """
+    Current catalog version, part of every fragment key.
+
+    Bumping it orphans all cached fragments at once. If the version key is
+    evicted it restarts from the clock, so it never goes back to a value
+    that older fragments were stored under.
+    """
+    cache = get_catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_catalog_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def invalidate_catalog():
+    """Invalidate cached catalog fragments once the current transaction commits."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def make_fragment_key(name, vary_on=()):
+    vary = ':'.join(str(value) for value in vary_on)
+    digest = hashlib.md5(f'{translation.get_language()}:{vary}'.encode()).hexdigest()
+    return f'catalog:{get_catalog_version()}:{name}:{digest}'
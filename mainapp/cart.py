@@ -0,0 +1,322 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.functional import cached_property
+from .models import Cart, CartItem, Product
+
+SESSION_CART_KEY = 'cart'
+# Stored as {"v": 1, "items": {"<product id>": quantity}}; prices are never
+# kept in the session, they are looked up when the cart is priced
+SESSION_CART_VERSION = 1
+_REQUEST_CACHE_ATTR = '_session_cart'
+_SUMMARY_CACHE_ATTR = '_cart_summary'
+
+CART_OPERATIONS = ('add', 'update', 'remove')
+MAX_CART_OPERATIONS = 100
+
+# How a guest quantity combines with the quantity already in the user's cart
+MERGE_POLICIES = {
+    'sum': lambda existing, guest: existing + guest,
+    'max': max,
+    'guest': lambda existing, guest: guest,
+    'account': lambda existing, guest: existing,
+}
+
+
+class SessionCart:
+    """
+    Priced view of the anonymous cart stored in the session.
+
+    All products referenced by the session are loaded with a single
+    ``in_bulk`` query; entries whose product no longer exists are skipped.
+    """
+
+    def __init__(self, session_cart):
+        self.source = session_cart
+        self.data = decode_session_cart(session_cart)
+        products = Product.objects.in_bulk(list(self.data)) if self.data else {}
+
+        self.items = []
+        self.total = Decimal('0')
+        for product_id, quantity in self.data.items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            subtotal = product.price * quantity
+            self.items.append({
+                'product': product,
+                'quantity': quantity,
+                'subtotal': subtotal
+            })
+            self.total += subtotal
+
+    @property
+    def count(self):
+        # Units of the products that still exist, matching ``items`` and ``total``
+        return sum(item['quantity'] for item in self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class CartSummary:
+    """
+    Badge figures for the current request's cart, loaded on first access.
+
+    Account carts are only read, never created; a user without a Cart row
+    has an empty cart until the first mutation persists one. Guest counts
+    come straight from the session and only the total prices products.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def _account_totals(self):
+        row = Cart.objects.filter(user=self.request.user).values_list('item_count', 'subtotal', 'discount').first()
+        return row or (0, Decimal('0.00'), Decimal('0.00'))
+
+    @cached_property
+    def count(self):
+        if self.request.user.is_authenticated:
+            return self._account_totals[0]
+        return sum(get_session_quantities(self.request).values())
+
+    @cached_property
+    def total(self):
+        if self.request.user.is_authenticated:
+            _, subtotal, discount = self._account_totals
+            return subtotal - discount
+        return get_session_cart(self.request).total
+
+
+def get_cart_summary(request):
+    """Return the lazy CartSummary for this request, shared by every render."""
+    summary = getattr(request, _SUMMARY_CACHE_ATTR, None)
+    if summary is None:
+        summary = CartSummary(request)
+        setattr(request, _SUMMARY_CACHE_ATTR, summary)
+    return summary
+
+
+def _quantity(item_data):
+    if isinstance(item_data, dict):
+        item_data = item_data.get('quantity', 1)
+    try:
+        return int(item_data)
+    except (TypeError, ValueError):
+        return 1
+
+
+def decode_session_cart(session_cart):
+    """
+    Return ``{product_id: quantity}`` from the stored cart.
+
+    Also reads the older unversioned format, which mapped product ids to
+    ``{'quantity': ..., 'price': ...}``, so carts from before the switch
+    survive until they are next saved.
+    """
+    if not isinstance(session_cart, dict):
+        return {}
+    items = session_cart.get('items', {}) if 'v' in session_cart else session_cart
+    if not isinstance(items, dict):
+        return {}
+    return {int(pid): _quantity(item) for pid, item in items.items() if str(pid).isdigit()}
+
+
+def encode_session_cart(quantities):
+    return {
+        'v': SESSION_CART_VERSION,
+        'items': {str(pid): _quantity(quantity) for pid, quantity in quantities.items()},
+    }
+
+
+def get_session_cart(request):
+    """
+    Return the priced session cart for this request, memoized so that the
+    context processor and the view share one product lookup.
+    """
+    session_cart = request.session.get(SESSION_CART_KEY, {})
+    cached = getattr(request, _REQUEST_CACHE_ATTR, None)
+    if cached is None or cached.source is not session_cart:
+        cached = SessionCart(session_cart)
+        setattr(request, _REQUEST_CACHE_ATTR, cached)
+    return cached
+
+
+def get_session_quantities(request):
+    """Return a copy of the session cart as ``{product_id: quantity}`` for modifying and saving back."""
+    return decode_session_cart(request.session.get(SESSION_CART_KEY, {}))
+
+
+def save_session_cart(request, quantities):
+    """Store a modified session cart and drop the memoized pricing."""
+    request.session[SESSION_CART_KEY] = encode_session_cart(quantities)
+    request.session.modified = True
+    if hasattr(request, _REQUEST_CACHE_ATTR):
+        delattr(request, _REQUEST_CACHE_ATTR)
+
+
+def merge_session_cart(request, user, policy=None):
+    """
+    Move the guest cart in ``request.session`` into ``user``'s Cart.
+
+    Runs a fixed number of queries whatever the cart size: one read of the
+    products and one of the matching cart items, then a single bulk_create,
+    bulk_update and totals UPDATE. Products already in the cart are resolved
+    by ``policy`` (default ``settings.CART_MERGE_POLICY``).
+    """
+    policy = policy or settings.CART_MERGE_POLICY
+    try:
+        combine = MERGE_POLICIES[policy]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown CART_MERGE_POLICY {policy!r}; choose from {', '.join(MERGE_POLICIES)}")
+
+    quantities = get_session_quantities(request)
+    if not quantities:
+        return None
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        product_ids = set(Product.objects.filter(pk__in=list(quantities)).values_list('pk', flat=True))
+        existing = {} if created else {
+            item.product_id: item for item in cart.items.filter(product_id__in=product_ids)
+        }
+
+        new_items, changed_items = [], []
+        for product_id in sorted(product_ids):
+            guest_quantity = quantities[product_id]
+            item = existing.get(product_id)
+            if item is None:
+                new_items.append(CartItem(cart=cart, product_id=product_id, quantity=guest_quantity))
+            else:
+                quantity = combine(item.quantity, guest_quantity)
+                if quantity != item.quantity:
+                    item.quantity = quantity
+                    changed_items.append(item)
+
+        # Bulk writes skip CartItem.save(), so the stored totals are rebuilt once at the end
+        if new_items:
+            CartItem.objects.bulk_create(new_items)
+        if changed_items:
+            CartItem.objects.bulk_update(changed_items, ['quantity'])
+        if new_items or changed_items:
+            Cart.objects.filter(pk=cart.pk).recalculate_totals()
+
+    request.session.pop(SESSION_CART_KEY, None)
+    if hasattr(request, _REQUEST_CACHE_ATTR):
+        delattr(request, _REQUEST_CACHE_ATTR)
+    return cart
+
+
+def parse_cart_operations(operations):
+    """
+    Validate a batch of ``{"op", "product_id", "quantity"}`` dicts.
+
+    Returns ``(op, product_id, quantity)`` tuples; raises ValueError with a
+    message fit for the client on anything malformed.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    if len(operations) > MAX_CART_OPERATIONS:
+        raise ValueError(f'At most {MAX_CART_OPERATIONS} operations per request')
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in CART_OPERATIONS:
+            raise ValueError(f"operations[{index}]: op must be one of {', '.join(CART_OPERATIONS)}")
+        try:
+            product_id = int(operation['product_id'])
+            quantity = int(operation.get('quantity', 1))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'operations[{index}]: product_id and quantity must be integers')
+        if quantity < 0:
+            raise ValueError(f'operations[{index}]: quantity must not be negative')
+        parsed.append((operation['op'], product_id, quantity))
+    return parsed
+
+
+def apply_cart_operations(quantities, operations):
+    """
+    Fold operations over ``{product_id: quantity}`` and return the new mapping.
+
+    ``add`` increases the quantity, ``update`` sets it (0 removes the line)
+    and ``remove`` drops the line.
+    """
+    quantities = dict(quantities)
+    for op, product_id, quantity in operations:
+        if op == 'add':
+            quantity += quantities.get(product_id, 0)
+        if op != 'remove' and quantity > 0:
+            quantities[product_id] = quantity
+        else:
+            quantities.pop(product_id, None)
+    return quantities
+
+
+def _check_products(product_ids):
+    found = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    missing = sorted(set(product_ids) - found)
+    if missing:
+        raise ValueError(f"Unknown products: {', '.join(map(str, missing))}")
+
+
+def batch_update_cart(user, operations):
+    """
+    Apply parsed operations to ``user``'s Cart in one transaction.
+
+    The products and the touched cart lines are read once, then written
+    with one DELETE and one upserting bulk_create; totals() then
+    recalculates and reads back the cart totals. The query count does not
+    depend on the number of operations.
+    """
+    product_ids = {product_id for _, product_id, _ in operations}
+    with transaction.atomic():
+        _check_products(product_ids)
+        cart, created = Cart.objects.get_or_create(user=user)
+        current = {} if created else dict(
+            cart.items.filter(product_id__in=product_ids).values_list('product_id', 'quantity')
+        )
+        quantities = apply_cart_operations(current, operations)
+
+        removed = [product_id for product_id in current if product_id not in quantities]
+        changed = [
+            CartItem(cart=cart, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items() if current.get(product_id) != quantity
+        ]
+        if removed:
+            cart.items.filter(product_id__in=removed).delete()
+        if changed:
+            CartItem.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity']
+            )
+        totals = Cart.objects.filter(pk=cart.pk).totals()
+    return _summary(totals, {product_id: quantities.get(product_id, 0) for product_id in product_ids})
+
+
+def batch_update_session_cart(request, operations):
+    """Apply parsed operations to the guest cart and save the session once."""
+    product_ids = {product_id for _, product_id, _ in operations}
+    _check_products(product_ids)
+    quantities = apply_cart_operations(get_session_quantities(request), operations)
+    save_session_cart(request, quantities)
+    session_cart = get_session_cart(request)
+    totals = {
+        'item_count': session_cart.count,
+        'subtotal': session_cart.total,
+        'discount': Decimal('0.00'),
+        'total': session_cart.total,
+    }
+    return _summary(totals, {product_id: quantities.get(product_id, 0) for product_id in product_ids})
+
+
+def _summary(totals, items):
+    return {
+        'cart_count': totals['item_count'],
+        'subtotal': str(totals['subtotal']),
+        'discount': str(totals['discount']),
+        'total': str(totals['total']),
+        'items': {str(product_id): quantity for product_id, quantity in items.items()},
+    }
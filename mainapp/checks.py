@@ -0,0 +1,14 @@
+from django.core.checks import Error, Tags, register
+from .assets import missing_vendor_assets
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_vendored_assets(app_configs, **kwargs):
+    return [
+        Error(
+            f'Vendored asset {path} is missing.',
+            hint='Run `python manage.py build_assets` and commit static/vendor/.',
+            id='mainapp.E001',
+        )
+        for path in missing_vendor_assets()
+    ]
@@ -1,28 +1,21 @@
-from .models import Cart
-from decimal import Decimal
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart_summary
+from .notifications import stream_supported
 
 def cart(request):
     """
     Context processor to make cart information available in all templates.
+
+    The values are lazy: a page that never shows the cart runs no cart
+    queries, and one that shows it several times runs them once.
     """
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_count = cart.items.count()
-        cart_total = cart.get_total()
-    else:
-        # Handle anonymous users
-        session_cart = request.session.get('cart', {})
-        cart_count = sum(int(item['quantity']) for item in session_cart.values())
-        cart_total = Decimal('0')
-        for product_id, item_data in session_cart.items():
-            try:
-                from .models import Product
-                product = Product.objects.get(id=product_id)
-                cart_total += product.price * Decimal(item_data['quantity'])
-            except Product.DoesNotExist:
-                continue
-    
+    summary = get_cart_summary(request)
     return {
-        'cart_count': cart_count,
-        'cart_total': cart_total,
-    } 
\ No newline at end of file
+        'cart_summary': summary,
+        'cart_count': SimpleLazyObject(lambda: summary.count),
+        'cart_total': SimpleLazyObject(lambda: summary.total),
+    }
+
+def notifications(request):
+    """Whether templates may open the message stream or should poll instead."""
+    return {'message_stream_enabled': stream_supported(request)}
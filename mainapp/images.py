@@ -0,0 +1,209 @@
+import hashlib
+import io
+import logging
+import multiprocessing
+import django
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+from .caching import get_catalog_cache, invalidate_catalog
+from .models import ImageDerivative, PendingImage, Product, ProductImage, ReviewImage, UserProduct, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Every uploaded image that gets variants: (model, field name)
+IMAGE_FIELDS = [
+    (Product, 'image'),
+    (ProductImage, 'image'),
+    (ReviewImage, 'image'),
+    (UserProduct, 'image'),
+    (UserProfile, 'profile_picture'),
+]
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+QUALITY = {'avif': 50, 'webp': 75, 'jpeg': 80}
+EXTENSIONS = {'jpeg': 'jpg'}
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def variant_path(digest, width, fmt):
+    return f'variants/{digest[:2]}/{digest}/{width}w.{EXTENSIONS.get(fmt, fmt)}'
+
+
+def variant_url(digest, width, fmt):
+    return default_storage.url(variant_path(digest, width, fmt))
+
+
+def enabled_formats():
+    """Configured formats this Pillow build can encode; JPEG is always kept as the fallback."""
+    formats = [fmt for fmt in settings.IMAGE_VARIANT_FORMATS if fmt == 'jpeg' or features.check(fmt)]
+    return formats if 'jpeg' in formats else formats + ['jpeg']
+
+
+def file_digest(name):
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_key(name):
+    return f"images:variants:{hashlib.md5(name.encode()).hexdigest()}"
+
+
+def _encode(image, fmt):
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha channel; flatten onto white instead of black
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=QUALITY[fmt])
+    return buffer.getvalue()
+
+
+def generate_variants(name, force=False):
+    """
+    Write the resized variants of the stored image ``name`` and record them.
+
+    Widths larger than the original are capped at the original width, so
+    small uploads are never upscaled. Returns the ImageDerivative, or None
+    when the file is missing or not an image.
+    """
+    if not force:
+        existing = ImageDerivative.objects.filter(source=name).first()
+        if existing:
+            return existing
+    if not default_storage.exists(name):
+        return None
+    try:
+        digest = file_digest(name)
+        with default_storage.open(name, 'rb') as f, Image.open(f) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not generate variants for {name}: {e}")
+        return None
+
+    width, height = image.size
+    widths = sorted({min(target, width) for target in settings.IMAGE_VARIANT_WIDTHS})
+    formats = enabled_formats()
+    for target in widths:
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.Resampling.LANCZOS
+        )
+        for fmt in formats:
+            path = variant_path(digest, target, fmt)
+            if force or not default_storage.exists(path):
+                default_storage.save(path, ContentFile(_encode(resized, fmt)))
+
+    derivative, _ = ImageDerivative.objects.update_or_create(source=name, defaults={
+        'digest': digest, 'width': width, 'height': height, 'widths': widths, 'formats': formats,
+    })
+    # Manifests live in the catalog cache, shared between processes when it is
+    # file/redis. Catalog fragments rendered with the plain <img> fallback
+    # while the variants were missing are dropped with the version bump.
+    get_catalog_cache().set(_cache_key(name), manifest(derivative), CACHE_TIMEOUT)
+    invalidate_catalog()
+    return derivative
+
+
+def manifest(derivative):
+    return {
+        'digest': derivative.digest,
+        'width': derivative.width,
+        'height': derivative.height,
+        'widths': derivative.widths,
+        'formats': derivative.formats,
+    }
+
+
+def get_variants(name):
+    """Variant manifest for ``name``, or None while it has not been generated yet."""
+    return get_variants_many([name])[name]
+
+
+def get_variants_many(names):
+    """
+    Manifests for several images at once: one cache round trip and at most
+    one ImageDerivative query. Returns ``{name: manifest or None}``.
+
+    Misses are not cached, so variants show up as soon as they are written.
+    """
+    cache = get_catalog_cache()
+    keys = {name: _cache_key(name) for name in names}
+    cached = cache.get_many(list(keys.values()))
+    manifests = {name: cached.get(key) for name, key in keys.items()}
+    missing = [name for name, found in manifests.items() if found is None]
+    if missing:
+        found = {
+            derivative.source: manifest(derivative)
+            for derivative in ImageDerivative.objects.filter(source__in=missing)
+        }
+        cache.set_many({keys[name]: value for name, value in found.items()}, CACHE_TIMEOUT)
+        manifests.update(found)
+    return manifests
+
+
+def generate_variants_task(name, force=False):
+    """Worker pool entry point; returns whether the image now has variants."""
+    derivative = generate_variants(name, force=force)
+    return derivative is not None
+
+
+def make_executor(workers):
+    # spawn: forking a process that holds open DB connections and threads is unsafe.
+    # Workers load settings from DJANGO_SETTINGS_MODULE, inherited from this process.
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_image_executor():
+    """Return the process-wide pool that generates variants off the request thread."""
+    return make_executor(settings.IMAGE_VARIANT_WORKERS)
+
+
+def schedule_variants(name):
+    """
+    Generate variants for ``name`` off the request.
+
+    Submitted to the worker pool when IMAGE_VARIANT_WORKERS > 0, otherwise
+    queued as a PendingImage for ``generate_image_variants --pending``.
+    """
+    if settings.IMAGE_VARIANT_WORKERS:
+        future = get_image_executor().submit(generate_variants_task, name)
+        future.add_done_callback(_log_failure(name))
+    elif not ImageDerivative.objects.filter(source=name).exists():
+        PendingImage.objects.get_or_create(source=name)
+
+
+def process_pending(batch_size=20):
+    """
+    Generate variants for the oldest queued images and dequeue them.
+
+    Images that cannot be processed (missing file, not an image) are
+    dequeued too; ``generate_variants`` has logged why. Returns
+    ``(generated, failed)``.
+    """
+    generated = failed = 0
+    for pending in PendingImage.objects.all()[:batch_size]:
+        ok = generate_variants(pending.source) is not None
+        generated += ok
+        failed += not ok
+        pending.delete()
+    return generated, failed
+
+
+def _log_failure(name):
+    def callback(future):
+        if future.exception() is not None:
+            logger.error(f"Generating variants for {name} failed", exc_info=future.exception())
+    return callback
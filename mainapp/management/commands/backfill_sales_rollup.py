@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from mainapp.models import DailySalesRollup, Order
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup from paid orders, streaming them in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of orders to fold into the rollup per query')
+        parser.add_argument('--since', type=str, default=None,
+                            help='Only rebuild days from this date (YYYY-MM-DD) onwards')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        orders = Order.objects.filter(paid=True)
+        rollups = DailySalesRollup.objects.all()
+        if options['since']:
+            orders = orders.filter(created_at__date__gte=options['since'])
+            rollups = rollups.filter(date__gte=options['since'])
+        # Delete and rebuild in one transaction, so an order paid meanwhile is
+        # either rebuilt from its lines or added afterwards, never both
+        last_pk = 0
+        processed = 0
+        with transaction.atomic():
+            rollups.delete()
+            while True:
+                batch = list(
+                    orders.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+                )
+                if not batch:
+                    break
+                DailySalesRollup.objects.add_orders(batch)
+                last_pk = batch[-1]
+                processed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {processed} paid orders'))
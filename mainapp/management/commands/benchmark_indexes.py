@@ -0,0 +1,184 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from mainapp.models import (
+    CustomUser, Category, Product, Cart, CartItem, Order, OrderItem,
+    UserProduct, Conversation, Message
+)
+
+INDEXED_MODELS = [Product, Order, OrderItem, CartItem, Conversation, Message]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a scratch test database and report query plans and timings for the '
+        'hot listing, order, cart and inbox queries with and without Meta.indexes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--messages', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Runs per query; the median is reported')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        # Never touch the real database: build and drop a throwaway test database
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            self.stdout.write('Seeding...')
+            fixtures = self.seed(options)
+            queries = self.queries(fixtures)
+
+            self.drop_indexes()
+            before = self.measure(queries)
+            self.create_indexes()
+            after = self.measure(queries)
+            self.report(queries, before, after)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def seed(self, options):
+        rng = random.Random(42)
+        now = timezone.now()
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(email=f'bench{i}@example.com', password='!') for i in range(options['users'])
+        ])
+        categories = Category.objects.bulk_create([
+            Category(name=f'Category {i}', slug=f'category-{i}') for i in range(20)
+        ])
+        products = Product.objects.bulk_create([
+            Product(
+                category=rng.choice(categories),
+                name=f'Product {i:06d}',
+                slug=f'product-{i}',
+                description='Benchmark product',
+                price=Decimal(rng.randint(100, 100000)) / 100,
+                image='products/benchmark.png',
+                stock=rng.randint(0, 100),
+                available=rng.random() > 0.1,
+            )
+            for i in range(options['products'])
+        ], batch_size=2000)
+        # auto_now_add ignores explicit values on insert; spread creation dates afterwards
+        for product in products:
+            product.created_at = now - timedelta(minutes=rng.randint(0, 525600))
+        Product.objects.bulk_update(products, ['created_at'], batch_size=2000)
+
+        orders = Order.objects.bulk_create([
+            Order(
+                user=rng.choice(users), first_name='Bench', last_name='Mark',
+                email='bench@example.com', phone='0900000000', address='-',
+                postal_code='1000', city='Addis Ababa', country='ET',
+                payment_method='cash', status=rng.choice(['pending', 'processing', 'delivered']),
+                paid=rng.random() > 0.3,
+            )
+            for _ in range(options['orders'])
+        ], batch_size=2000)
+        for order in orders:
+            order.created_at = now - timedelta(minutes=rng.randint(0, 525600))
+        Order.objects.bulk_update(orders, ['created_at'], batch_size=2000)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=rng.choice(products), price=Decimal('10.00'), quantity=rng.randint(1, 3))
+            for order in orders for _ in range(rng.randint(1, 4))
+        ], batch_size=5000)
+
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product)
+            for cart in carts for product in rng.sample(products, 5)
+        ], batch_size=5000)
+
+        listings = UserProduct.objects.bulk_create([
+            UserProduct(seller=rng.choice(users), name=f'Listing {i}', description='-',
+                        price=Decimal('5.00'), image='user_products/benchmark.png', slug=f'listing-{i}')
+            for i in range(200)
+        ])
+        conversations = Conversation.objects.bulk_create([
+            Conversation(product=listing, seller=listing.seller, buyer=buyer)
+            for listing in listings for buyer in rng.sample(users, 5)
+        ])
+        Message.objects.bulk_create([
+            Message(conversation=rng.choice(conversations), sender=rng.choice(users),
+                    content='Hello', is_read=rng.random() > 0.2)
+            for _ in range(options['messages'])
+        ], batch_size=5000)
+
+        return {
+            'user': users[0],
+            'category': categories[0],
+            'cart_item': CartItem.objects.first(),
+            'product': OrderItem.objects.values('product').order_by('product').first()['product'],
+            'conversation': conversations[0],
+            'month_ago': now - timedelta(days=30),
+        }
+
+    def queries(self, fixtures):
+        listing = Product.objects.filter(available=True)
+        return {
+            'listing by category, price': lambda: listing.filter(category=fixtures['category']).order_by('price', 'id')[:12],
+            'listing by category, newest': lambda: listing.filter(category=fixtures['category']).order_by('-created_at', '-id')[:12],
+            'listing by name': lambda: listing.order_by('name', 'id')[:12],
+            'listing by price': lambda: listing.order_by('price', 'id')[:12],
+            'order history': lambda: Order.objects.filter(user=fixtures['user']).order_by('-created_at')[:20],
+            'dashboard orders by status': lambda: Order.objects.filter(user=fixtures['user'], status='pending'),
+            'paid sales window': lambda: Order.objects.filter(paid=True, created_at__gte=fixtures['month_ago']).values('id'),
+            'product sales': lambda: OrderItem.objects.filter(product=fixtures['product'], order__paid=True).values('order'),
+            'cart item lookup': lambda: CartItem.objects.filter(
+                cart_id=fixtures['cart_item'].cart_id, product_id=fixtures['cart_item'].product_id
+            ),
+            'inbox as buyer': lambda: Conversation.objects.filter(buyer=fixtures['user']).order_by('-last_message_at')[:20],
+            'inbox as seller': lambda: Conversation.objects.filter(seller=fixtures['user']).order_by('-last_message_at')[:20],
+            'unread messages': lambda: Message.objects.filter(conversation=fixtures['conversation'], is_read=False),
+            'conversation thread': lambda: Message.objects.filter(conversation=fixtures['conversation']).order_by('created_at'),
+        }
+
+    def measure(self, queries):
+        results = {}
+        for name, build in queries.items():
+            queryset = build()
+            plan = queryset.explain()
+            timings = []
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                list(build())
+                timings.append(time.perf_counter() - start)
+            results[name] = (statistics.median(timings) * 1000, plan)
+        return results
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def create_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def report(self, queries, before, after):
+        for name in queries:
+            before_ms, before_plan = before[name]
+            after_ms, after_plan = after[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f'  without indexes: {before_ms:8.3f} ms')
+            self.stdout.write(self.indent(before_plan))
+            self.stdout.write(f'  with indexes:    {after_ms:8.3f} ms')
+            self.stdout.write(self.indent(after_plan))
+
+    @staticmethod
+    def indent(plan):
+        return '\n'.join(f'      {line}' for line in plan.splitlines())
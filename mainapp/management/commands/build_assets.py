@@ -0,0 +1,38 @@
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from mainapp.assets import clear_asset_urls, missing_vendor_assets, vendor_assets
+
+
+class Command(BaseCommand):
+    help = (
+        'Download the third-party CSS/JS/fonts into static/vendor/, then collect, '
+        'fingerprint and precompress all static files'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true',
+                            help='Download vendored files again even if they exist')
+        parser.add_argument('--skip-vendor', action='store_true',
+                            help='Use the committed static/vendor/ files, e.g. on a host without internet access')
+        parser.add_argument('--check', action='store_true',
+                            help='Only verify that every vendored file is present')
+
+    def handle(self, *args, **options):
+        if not options['skip_vendor'] and not options['check']:
+            try:
+                written = vendor_assets(settings.STATICFILES_DIRS[0], refresh=options['refresh'])
+            except requests.RequestException as e:
+                raise CommandError(f'Could not download vendored assets: {e}')
+            self.stdout.write(f'Vendored {len(written)} files')
+        clear_asset_urls()
+
+        missing = missing_vendor_assets()
+        if missing:
+            raise CommandError(f"Vendored assets are missing: {', '.join(missing)}")
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('All vendored assets are present'))
+            return
+        call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
+        self.stdout.write(self.style.SUCCESS('Static assets built'))
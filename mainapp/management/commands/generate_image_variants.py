@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import as_completed
+from django.core.management.base import BaseCommand
+from mainapp.images import IMAGE_FIELDS, generate_variants, generate_variants_task, make_executor, process_pending
+from mainapp.models import ImageDerivative
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive image variants for uploaded media that does not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of worker processes; 0 generates in this process')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate variants for images that already have them')
+        parser.add_argument('--pending', action='store_true',
+                            help='Only process images queued by uploads instead of scanning all media')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Number of queued images to process per batch with --pending')
+        parser.add_argument('--loop', action='store_true',
+                            help='With --pending, keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls when the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            return self.handle_pending(options)
+        names = set()
+        for model, field_name in IMAGE_FIELDS:
+            names.update(
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list(field_name, flat=True).distinct().iterator()
+            )
+        if not options['force']:
+            names -= set(ImageDerivative.objects.values_list('source', flat=True).iterator())
+
+        generated = failed = 0
+        if options['workers']:
+            with make_executor(options['workers']) as executor:
+                futures = {executor.submit(generate_variants_task, name, options['force']): name for name in names}
+                for future in as_completed(futures):
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        self.stderr.write(f'{futures[future]}: {e}')
+                        ok = False
+                    generated += ok
+                    failed += not ok
+        else:
+            for name in names:
+                ok = generate_variants(name, force=options['force']) is not None
+                generated += ok
+                failed += not ok
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {generated} images, {failed} failed'))
+
+    def handle_pending(self, options):
+        while True:
+            generated, failed = process_pending(options['batch_size'])
+            if generated or failed:
+                self.stdout.write(f'Generated variants for {generated} images, {failed} failed')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Image variant queue is empty'))
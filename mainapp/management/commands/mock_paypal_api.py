@@ -0,0 +1,91 @@
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+
+
+class MockPayPalHandler(BaseHTTPRequestHandler):
+    """
+    Answers the OAuth token and payment creation calls made by paypalrestsdk,
+    with configurable latency. ``token_requests`` counts issued tokens.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    token_lifetime = 32400
+    token_requests = 0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.path == '/v1/oauth2/token':
+            type(self).token_requests += 1
+            return self._reply(200, {
+                'access_token': uuid.uuid4().hex,
+                'token_type': 'Bearer',
+                'expires_in': self.token_lifetime,
+            })
+        if self.path == '/v1/payments/payment':
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                return self._reply(401, {'name': 'AUTHENTICATION_FAILURE'})
+            payment_id = f'PAY-{uuid.uuid4().hex[:20].upper()}'
+            return self._reply(201, {
+                **json.loads(body or b'{}'),
+                'id': payment_id,
+                'state': 'created',
+                'links': [{
+                    'href': f"http://{self.headers.get('Host')}/checkout/{payment_id}",
+                    'rel': 'approval_url',
+                    'method': 'REDIRECT',
+                }],
+            })
+        return self._reply(404, {'name': 'NOT_FOUND'})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host='127.0.0.1', port=0, latency=0.0, token_lifetime=32400):
+    handler = type('ConfiguredMockPayPalHandler', (MockPayPalHandler,), {
+        'latency': latency,
+        'token_lifetime': token_lifetime,
+        'token_requests': 0,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local stub of the PayPal REST API for development and benchmarks; '
+        'point PAYPAL_API_ENDPOINT at it'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8002)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds to wait before answering each request')
+
+    def handle(self, *args, **options):
+        server = make_server(options['host'], options['port'], options['latency'])
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(
+            f'Mock PayPal API on http://{host}:{port}/ (PAYPAL_API_ENDPOINT=http://{host}:{port})'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,78 @@
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+
+
+class MockGatewayHandler(BaseHTTPRequestHandler):
+    """
+    Answers payment (``POST <path>``) and verification (``POST <path>/verify``)
+    calls like the Telebirr gateway, with configurable latency and failures.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    failure_rate = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            return self._reply(503, {'success': False, 'message': 'Gateway busy'})
+        if self.path.rstrip('/').endswith('/verify'):
+            return self._reply(200, {'success': True, 'outTradeNo': payload.get('outTradeNo')})
+        return self._reply(200, {
+            'success': True,
+            'paymentUrl': f"http://{self.headers.get('Host')}/pay/{payload.get('appId', '')}",
+        })
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0):
+    handler = type('ConfiguredMockGatewayHandler', (MockGatewayHandler,), {
+        'latency': latency,
+        'failure_rate': failure_rate,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local mock of the Telebirr gateway for development and load tests; '
+        'point TELEBIRR_API_URL at it'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds to wait before answering each request')
+        parser.add_argument('--failure-rate', type=float, default=0.0,
+                            help='Fraction of requests answered with 503')
+
+    def handle(self, *args, **options):
+        server = make_server(options['host'], options['port'], options['latency'], options['failure_rate'])
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(
+            f'Mock Telebirr gateway on http://{host}:{port}/ '
+            f'(TELEBIRR_API_URL=http://{host}:{port}/payment)'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from mainapp.services import PaymentNotificationProcessor
+
+
+class Command(BaseCommand):
+    help = 'Verify recorded Telebirr payment notifications in batches and mark their orders paid'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Number of notifications to claim per batch')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Give up on a notification after this many gateway failures')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Seconds after which a notification left in processing is claimed again')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the inbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls when the inbox is empty')
+
+    def handle(self, *args, **options):
+        processor = PaymentNotificationProcessor(
+            max_attempts=options['max_attempts'],
+            stale_after=timedelta(seconds=options['stale_after'])
+        )
+        while True:
+            outcomes = processor.process_batch(options['batch_size'])
+            if outcomes:
+                self.stdout.write(', '.join(f'{status}: {count}' for status, count in sorted(outcomes.items())))
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Payment notification inbox is empty'))
@@ -0,0 +1,32 @@
+from importlib import import_module
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired sessions from the database in small batches, so the '
+        'session table is never locked by one large DELETE'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of sessions deleted per statement')
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not issubclass(store, DatabaseSessionStore):
+            # The cache and cookie backends expire sessions on their own
+            self.stdout.write(f'{settings.SESSION_ENGINE} does not keep sessions in the database')
+            return
+
+        sessions = store.get_model_class().objects.filter(expire_date__lt=timezone.now())
+        deleted = 0
+        while True:
+            batch = list(sessions.values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            deleted += store.get_model_class().objects.filter(pk__in=batch).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from mainapp.models import Product
+from mainapp.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Drop and rebuild the product full-text search index'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Product.objects.count()} products with {type(backend).__name__}'
+        ))
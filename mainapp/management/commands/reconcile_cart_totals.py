@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from mainapp.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored item count, subtotal and discount of every cart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of carts to recompute per UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cart_ids = list(Cart.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(cart_ids), batch_size):
+            batch = cart_ids[start:start + batch_size]
+            updated += Cart.objects.filter(pk__in=batch).recalculate_totals()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled totals for {updated} carts'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, OuterRef, Subquery
+from mainapp.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill in missing message recipients and recompute the unread counters '
+        'and last message of every conversation'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of conversations to recompute per UPDATE')
+
+    def handle(self, *args, **options):
+        conversation = Conversation.objects.filter(pk=OuterRef('conversation'))
+        missing = Message.objects.filter(recipient__isnull=True)
+        filled = missing.filter(conversation__buyer=F('sender')).update(
+            recipient=Subquery(conversation.values('seller')[:1])
+        )
+        filled += missing.update(recipient=Subquery(conversation.values('buyer')[:1]))
+
+        batch_size = options['batch_size']
+        conversation_ids = list(Conversation.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(conversation_ids), batch_size):
+            batch = conversation_ids[start:start + batch_size]
+            updated += Conversation.objects.filter(pk__in=batch).recalculate_unread()
+        self.stdout.write(self.style.SUCCESS(
+            f'Filled {filled} message recipients and reconciled {updated} conversations'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from mainapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored item count and item summary of every order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of orders to recompute per batch')
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only fill in orders that have no stored summary yet')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        orders = Order.objects.order_by('pk')
+        if options['missing_only']:
+            orders = orders.filter(items_summary='')
+        order_ids = list(orders.values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(order_ids), batch_size):
+            batch = order_ids[start:start + batch_size]
+            updated += Order.objects.filter(pk__in=batch).recalculate_item_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled item summaries for {updated} orders'))
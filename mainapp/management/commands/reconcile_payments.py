@@ -0,0 +1,85 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from mainapp.models import Order, Payment, TelebirrPayment
+from mainapp.services import get_telebirr_service
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-verify Telebirr payments stuck in pending with the gateway, concurrently, '
+        'and apply the results in bulk'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=15,
+                            help='Only check payments pending for at least this many minutes')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Number of payments loaded and written back per chunk')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of concurrent gateway requests')
+
+    def handle(self, *args, **options):
+        self.service = get_telebirr_service()
+        cutoff = timezone.now() - timedelta(minutes=options['older_than'])
+        stats = Counter()
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for model, payments in [
+                (TelebirrPayment, TelebirrPayment.objects.all()),
+                (Payment, Payment.objects.filter(payment_method='telebirr')),
+            ]:
+                pending = payments.filter(status='pending', created_at__lt=cutoff)
+                for chunk in self.chunks(pending, options['chunk_size']):
+                    stats += self.reconcile(model, chunk, executor)
+
+        elapsed = time.monotonic() - started
+        checked = sum(stats[key] for key in ('completed', 'failed', 'unavailable', 'errors'))
+        rate = checked / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} payments in {elapsed:.1f}s ({rate:.1f}/s): "
+            f"{stats['completed']} completed, {stats['failed']} failed, "
+            f"{stats['unavailable']} left pending (gateway unavailable), {stats['errors']} errors, "
+            f"{stats['orders_paid']} orders marked paid"
+        ))
+
+    @staticmethod
+    def chunks(queryset, size):
+        # Keyset over pk, so rows that change status mid-run do not shift later chunks
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def reconcile(self, model, payments, executor):
+        # Threads only talk to the gateway; all database writes happen here, in bulk
+        results = executor.map(
+            lambda payment: self.service.verify_payment(payment.transaction_id, payment=payment, save=False),
+            payments
+        )
+        stats = Counter()
+        changed = []
+        for payment, result in zip(payments, results):
+            if result.get('retry'):
+                stats['unavailable'] += 1
+            elif payment.status in ('completed', 'failed'):
+                stats[payment.status] += 1
+                changed.append(payment)
+            else:
+                stats['errors'] += 1
+
+        now = timezone.now()
+        for payment in changed:
+            payment.updated_at = now
+        with transaction.atomic():
+            model.objects.bulk_update(changed, ['status', 'updated_at'])
+            paid_orders = {payment.order_id for payment in changed if payment.status == 'completed'}
+            stats['orders_paid'] += len(Order.objects.filter(pk__in=paid_orders).mark_paid())
+        return stats
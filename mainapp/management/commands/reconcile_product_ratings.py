@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from mainapp.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating average, count and histogram of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products to recompute per UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            updated += Product.objects.filter(pk__in=batch).recalculate_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled ratings for {updated} products'))
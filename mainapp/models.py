@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value, ExpressionWrapper
+from django.db.models.functions import Coalesce, Greatest, NullIf, Round, TruncDate
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
@@ -54,6 +56,44 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+RATING_STARS = range(1, 6)
+
+def _rating_summary(histogram):
+    """Count and average expressions for a {field: expression} star histogram."""
+    count = sum(histogram.values())
+    weighted = sum(histogram[f'rating_{star}'] * star for star in RATING_STARS)
+    # Multiply by a float before dividing to avoid integer division; round to
+    # the field's 2 places so the stored value equals what Python reads back
+    # (keyset cursors compare against it)
+    average = Coalesce(
+        Round(weighted * Value(1.0) / NullIf(count, Value(0)), 2),
+        Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=3, decimal_places=2)
+    )
+    return {'rating_count': count, 'rating_avg': average}
+
+class ProductQuerySet(models.QuerySet):
+    def apply_rating_delta(self, added=None, removed=None):
+        """Move one review into and/or out of the stored histogram in a single UPDATE."""
+        histogram = {f'rating_{star}': F(f'rating_{star}') for star in RATING_STARS}
+        if added in RATING_STARS:
+            histogram[f'rating_{added}'] = histogram[f'rating_{added}'] + 1
+        if removed in RATING_STARS:
+            histogram[f'rating_{removed}'] = histogram[f'rating_{removed}'] - 1
+        return self.update(**histogram, **_rating_summary(histogram))
+
+    def recalculate_ratings(self):
+        """Recompute the stored rating aggregates from the reviews in a single UPDATE."""
+        reviews = ProductReview.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        histogram = {
+            f'rating_{star}': Coalesce(
+                Subquery(reviews.filter(rating=star).annotate(count=models.Count('pk')).values('count')),
+                Value(0)
+            )
+            for star in RATING_STARS
+        }
+        return self.update(**histogram, **_rating_summary(histogram))
+
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     name = models.CharField(max_length=200)
@@ -65,15 +105,69 @@ class Product(models.Model):
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Review aggregates, maintained by the ProductReview signal handlers
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
+
+    RATING_FIELDS = ('rating_avg', 'rating_count') + tuple(f'rating_{star}' for star in RATING_STARS)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-rating_avg', '-rating_count'], name='product_rating_idx'),
+            # Storefront listings only ever show available products, sorted by one of these keys
+            models.Index(fields=['category', 'name', 'id'], name='product_cat_name_idx',
+                         condition=models.Q(available=True)),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx',
+                         condition=models.Q(available=True)),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_newest_idx',
+                         condition=models.Q(available=True)),
+            models.Index(fields=['name', 'id'], name='product_name_idx',
+                         condition=models.Q(available=True)),
+            models.Index(fields=['price', 'id'], name='product_price_idx',
+                         condition=models.Q(available=True)),
+            models.Index(fields=['-created_at', '-id'], name='product_newest_idx',
+                         condition=models.Q(available=True)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        # Never write the rating aggregates from memory; they are only changed by UPDATE ... F()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATING_FIELDS
+            ]
+        price_changed = (
+            not self._state.adding
+            and getattr(self, '_loaded_price', None) is not None
+            and self._loaded_price != self.price
+        )
         super().save(*args, **kwargs)
+        self._loaded_price = self.price
+        if price_changed:
+            # Stored cart totals are priced at the old value
+            Cart.objects.filter(items__product=self).recalculate_totals()
 
     def __str__(self):
         return self.name
 
+    def get_rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}') for star in RATING_STARS}
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='additional_images')
     image = models.ImageField(upload_to='products/additional/')
@@ -86,35 +180,259 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"Image for {self.product.name}"
 
+def _cart_discount(subtotal):
+    """Discount expression for ``subtotal`` using the cart's own coupon row."""
+    percent = Coalesce(
+        Subquery(Coupon.objects.filter(pk=OuterRef('coupon_id')).values('discount')[:1]),
+        Value(0)
+    )
+    # Multiply by 0.01 rather than dividing by 100 to avoid integer division on SQLite
+    return ExpressionWrapper(
+        subtotal * percent * Value(Decimal('0.01')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    )
+
+class CartQuerySet(models.QuerySet):
+    def apply_item_delta(self, count, amount):
+        """Shift the stored totals by a cart item change in a single UPDATE."""
+        subtotal = F('subtotal') + Value(amount)
+        return self.update(
+            item_count=F('item_count') + count,
+            subtotal=subtotal,
+            discount=_cart_discount(subtotal)
+        )
+
+    def recalculate_totals(self):
+        """Recompute the stored totals from the cart items in a single UPDATE."""
+        return self.update(**self._recalculated_totals())
+
+    def _recalculated_totals(self):
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        item_count = Coalesce(
+            Subquery(items.annotate(count=Sum('quantity')).values('count')),
+            Value(0)
+        )
+        subtotal = Coalesce(
+            Subquery(items.annotate(
+                total=Sum(F('quantity') * F('product__price'))
+            ).values('total')),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        )
+        return {
+            'item_count': item_count,
+            'subtotal': subtotal,
+            'discount': _cart_discount(subtotal),
+        }
+
+    # Cart mutations. They address the cart through this queryset (e.g.
+    # ``Cart.objects.filter(user=user)``) so the cart row is never loaded
+    # first; add_item() relies on INSERT ... ON CONFLICT (PostgreSQL, SQLite
+    # 3.24+). Call totals() afterwards in the same transaction for the fresh
+    # count and totals.
+
+    def add_item(self, product_id, quantity, replace=False):
+        """
+        Insert a product into the cart in one statement.
+
+        An existing row is kept as is, or has its quantity overwritten when
+        ``replace`` is set. Returns whether a row was written, so False means
+        the product was already in the cart (or there is no cart yet).
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        cart_sql, cart_params = self.order_by('id').values('id')[:1].query.sql_with_params()
+        on_conflict = f'UPDATE SET {qn("quantity")} = EXCLUDED.{qn("quantity")}' if replace else 'NOTHING'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {qn(CartItem._meta.db_table)} ({qn("cart_id")}, {qn("product_id")}, {qn("quantity")}) '
+                f'SELECT cart.{qn("id")}, %s, %s FROM ({cart_sql}) cart WHERE 1 = 1 '
+                f'ON CONFLICT ({qn("cart_id")}, {qn("product_id")}) DO {on_conflict}',
+                (product_id, quantity, *cart_params)
+            )
+            return cursor.rowcount > 0
+
+    def update_item(self, item_id, quantity):
+        """Set an item's quantity; returns its new cost, or None if it is not in the cart."""
+        items = CartItem.objects.using(self.db).filter(pk=item_id, cart__in=self.values('pk'))
+        with transaction.atomic(using=self.db):
+            if not items.update(quantity=quantity):
+                return None
+            cost = ExpressionWrapper(
+                F('quantity') * F('product__price'),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            )
+            return items.annotate(cost=cost).values_list('cost', flat=True).first()
+
+    def remove_item(self, item_id=None, product_id=None):
+        """Delete an item by id or product in one statement; returns whether it existed."""
+        items = CartItem.objects.using(self.db).filter(cart__in=self.values('pk'))
+        items = items.filter(pk=item_id) if item_id is not None else items.filter(product_id=product_id)
+        return items.delete()[0] > 0
+
+    def totals(self):
+        """
+        Recompute the stored totals and read them back.
+
+        Returns ``{'item_count', 'subtotal', 'discount', 'total'}`` for the
+        first cart, or None when the queryset matches no cart. The UPDATE
+        keeps the cart rows locked until the transaction ends, so the values
+        read are the ones just written.
+        """
+        with transaction.atomic(using=self.db):
+            if not self.update(**self._recalculated_totals()):
+                return None
+            item_count, subtotal, discount = self.order_by('pk').values_list(*Cart.TOTAL_FIELDS).first()
+        return {
+            'item_count': item_count,
+            'subtotal': subtotal,
+            'discount': discount,
+            'total': subtotal - discount,
+        }
+
+
 class Cart(models.Model):
+    TOTAL_FIELDS = ('item_count', 'subtotal', 'discount')
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     coupon = models.ForeignKey('Coupon', on_delete=models.SET_NULL, null=True, blank=True)
+    # Denormalized totals, maintained by CartItem.save()/delete() and Cart.save().
+    # item_count is in units (the sum of quantities), like guest carts and orders.
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # One cart per account: the cart views look it up by user, and a
+            # double-clicked first "add to cart" must not create a second one
+            models.UniqueConstraint(fields=['user'], name='cart_user_uniq'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_coupon_id = instance.__dict__.get('coupon_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Never write the totals from memory; they are only changed by UPDATE ... F()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TOTAL_FIELDS
+            ]
+        coupon_changed = self.coupon_id != getattr(self, '_loaded_coupon_id', None)
+        super().save(*args, **kwargs)
+        self._loaded_coupon_id = self.coupon_id
+        if coupon_changed:
+            Cart.objects.filter(pk=self.pk).update(discount=_cart_discount(F('subtotal')))
+            self.refresh_totals()
+
+    def refresh_totals(self):
+        self.refresh_from_db(fields=self.TOTAL_FIELDS)
+
+    def clear(self):
+        """Delete all items and reset the stored totals."""
+        with transaction.atomic():
+            self.items.all().delete()
+            Cart.objects.filter(pk=self.pk).update(item_count=0, subtotal=0, discount=0)
+        self.item_count = 0
+        self.subtotal = Decimal('0')
+        self.discount = Decimal('0')
 
     def get_total(self):
-        total = sum(item.get_cost() for item in self.items.all())
-        if self.coupon:
-            discount = (total * Decimal(self.coupon.discount)) / Decimal('100')
-            total = total - discount
-        return total
+        return self.subtotal - self.discount
 
     def get_subtotal(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.subtotal
 
     def get_discount(self):
-        if self.coupon:
-            subtotal = self.get_subtotal()
-            return (subtotal * Decimal(self.coupon.discount)) / Decimal('100')
-        return Decimal('0')
+        return self.discount
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # Also serves the (cart, product) lookups; lets add_item() upsert
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_cart_product_uniq'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: instance.__dict__.get(name) for name in ('product_id', 'quantity')
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        loaded = getattr(self, '_loaded_values', {})
+        carts = Cart.objects.filter(pk=self.cart_id)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                carts.apply_item_delta(int(self.quantity), self.get_cost())
+            elif loaded.get('quantity') is None or loaded.get('product_id') != self.product_id:
+                carts.recalculate_totals()
+            else:
+                quantity_delta = int(self.quantity) - int(loaded['quantity'])
+                if quantity_delta:
+                    carts.apply_item_delta(quantity_delta, self.product.price * quantity_delta)
+        self._loaded_values = {'product_id': self.product_id, 'quantity': self.quantity}
+        self._refresh_cart()
+
+    def delete(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_values', {})
+        quantity = loaded.get('quantity') or self.quantity
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Cart.objects.filter(pk=self.cart_id).apply_item_delta(-int(quantity), -(self.product.price * int(quantity)))
+        self._refresh_cart()
+        return result
+
+    def _refresh_cart(self):
+        if CartItem.cart.is_cached(self):
+            self.cart.refresh_totals()
+
     def get_cost(self):
-        return self.product.price * self.quantity
+        return self.product.price * int(self.quantity)
+
+class OrderQuerySet(models.QuerySet):
+    def mark_paid(self, status='processing'):
+        """
+        Flip the unpaid orders in this queryset to paid with one UPDATE and
+        add them to the sales rollup, as Order.save() would. The rows are
+        locked first so concurrent callers flip each order only once.
+        Returns the ids that were flipped.
+        """
+        with transaction.atomic():
+            order_ids = list(self.select_for_update().filter(paid=False).values_list('pk', flat=True))
+            if order_ids:
+                Order.objects.filter(pk__in=order_ids).update(paid=True, status=status, updated_at=timezone.now())
+                DailySalesRollup.objects.add_orders(order_ids)
+        return order_ids
+
+    def recalculate_item_summaries(self):
+        """
+        Rebuild the stored item count and summary of these orders from their
+        lines, for orders placed before the fields existed. Returns the
+        number of orders updated.
+        """
+        orders = list(self.prefetch_related('items__product'))
+        for order in orders:
+            items = order.items.all()
+            order.item_count = sum(item.quantity for item in items)
+            order.items_summary = Order.describe_items(items)
+        return Order.objects.bulk_update(orders, ['item_count', 'items_summary'])
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -149,19 +467,54 @@ class Order(models.Model):
     paid = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized at checkout so listings and payment requests never read the lines
+    item_count = models.PositiveIntegerField(default=0)
+    items_summary = models.TextField(blank=True)
+
+    objects = OrderQuerySet.as_manager()
 
     def __str__(self):
         return f"Order #{self.id} - {self.user.email}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_paid = instance.__dict__.get('paid', False)
+        return instance
+
+    def save(self, *args, **kwargs):
+        was_paid = getattr(self, '_loaded_paid', False)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Fold the order into the sales rollup when it becomes paid, and back out if it is unpaid again
+            if self.paid != was_paid:
+                DailySalesRollup.objects.add_orders([self.pk], sign=1 if self.paid else -1)
+        self._loaded_paid = self.paid
+
     def get_total_cost(self):
         return self.total
 
     def get_items_description(self):
+        if self.items_summary:
+            return self.items_summary
+        # Older orders without a stored summary; uses prefetched items when present
         items = self.items.all()
+        if 'items' not in getattr(self, '_prefetched_objects_cache', {}):
+            items = items.select_related('product')
+        return self.describe_items(items)
+
+    @staticmethod
+    def describe_items(items):
         return ", ".join([f"{item.product.name} x {item.quantity}" for item in items])
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            models.Index(fields=['created_at'], name='order_paid_created_idx',
+                         condition=models.Q(paid=True)),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -169,9 +522,111 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Lines written to an already-paid order (including one created paid
+        # before its lines) go into the rollup; an edited line is swapped out
+        with transaction.atomic():
+            paid = Order.objects.filter(pk=self.order_id, paid=True).exists()
+            if paid and not self._state.adding:
+                DailySalesRollup.objects.add_lines(OrderItem.objects.filter(pk=self.pk), sign=-1)
+            super().save(*args, **kwargs)
+            if paid:
+                DailySalesRollup.objects.add_lines(OrderItem.objects.filter(pk=self.pk))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if Order.objects.filter(pk=self.order_id, paid=True).exists():
+                DailySalesRollup.objects.add_lines(OrderItem.objects.filter(pk=self.pk), sign=-1)
+            return super().delete(*args, **kwargs)
+
     def get_cost(self):
         return self.price * self.quantity
 
+class DailySalesRollupQuerySet(models.QuerySet):
+    def add_orders(self, order_ids, sign=1):
+        """
+        Add (or with ``sign=-1`` subtract) the lines of the given orders to
+        the per-day, per-product rows.
+        """
+        self.add_lines(OrderItem.objects.filter(order__in=order_ids), sign=sign)
+
+    def add_lines(self, items, sign=1):
+        """
+        Add (or subtract) the OrderItems in ``items``. Each order's discount
+        is spread over its lines in proportion to their share of the
+        subtotal. Orders hold one line per product, so each order counts
+        once towards ``order_count`` per product.
+        """
+        line_total = ExpressionWrapper(
+            F('price') * F('quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        )
+        line_discount = ExpressionWrapper(
+            line_total * Value(1.0) * F('order__discount') / NullIf(F('order__subtotal'), 0),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        )
+        rows = items.annotate(
+            day=TruncDate('order__created_at')
+        ).values('day', 'product', 'product__category').annotate(
+            units=Sum('quantity'),
+            gross=Sum(line_total),
+            line_discount=Sum(line_discount),
+            orders=models.Count('order', distinct=True),
+        ).order_by()
+        for row in rows:
+            self._apply(row['day'], row['product'], row['product__category'], {
+                'units': sign * row['units'],
+                'gross': sign * row['gross'],
+                'discount': sign * (row['line_discount'] or Decimal('0')).quantize(Decimal('0.01')),
+                'order_count': sign * row['orders'],
+            })
+
+    def _apply(self, day, product_id, category_id, deltas):
+        key = {'date': day, 'product_id': product_id}
+        increments = {field: F(field) + Value(delta) for field, delta in deltas.items()}
+        if self.filter(**key).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                self.create(category_id=category_id, **key, **deltas)
+        except IntegrityError:
+            # Another transaction created the row first
+            self.filter(**key).update(**increments)
+
+class DailySalesRollup(models.Model):
+    """
+    Paid sales per day and product, maintained by Order.save() when an
+    order's ``paid`` flag changes and by OrderItem.save()/delete() for lines
+    of orders that are already paid; rebuilt by ``backfill_sales_rollup``.
+    The day is the order's creation date in the current time zone.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_sales')
+    units = models.PositiveIntegerField(default=0)
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    objects = DailySalesRollupQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='dailysales_date_product_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'category'], name='dailysales_date_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.product_id}"
+
 class Coupon(models.Model):
     code = models.CharField(max_length=50, unique=True)
     discount = models.IntegerField(validators=[MinValueValidator(0), MinValueValidator(100)])
@@ -221,6 +676,14 @@ class ProductReview(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['product', 'user']  # One review per product per user
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: instance.__dict__.get(name) for name in ('product_id', 'rating')
+        }
+        return instance
     
     def __str__(self):
         return f"{self.user.username}'s review of {self.product.name}"
@@ -287,22 +750,111 @@ class UserProduct(models.Model):
     def __str__(self):
         return f"{self.name} by {self.seller.username}"
 
+class ConversationQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Conversations ``user`` takes part in, annotated with their own ``unread_count``."""
+        return self.filter(models.Q(buyer=user) | models.Q(seller=user)).annotate(
+            unread_count=models.Case(
+                models.When(buyer=user, then=F('buyer_unread')),
+                default=F('seller_unread')
+            )
+        )
+
+    def unread_total(self, user):
+        """Unread messages for ``user`` across all of their conversations, in one query."""
+        totals = self.aggregate(
+            as_buyer=Sum('buyer_unread', filter=models.Q(buyer=user)),
+            as_seller=Sum('seller_unread', filter=models.Q(seller=user)),
+        )
+        return (totals['as_buyer'] or 0) + (totals['as_seller'] or 0)
+
+    def record_message(self, message):
+        """Point the conversation at ``message`` and bump its recipient's unread counter."""
+        return self.update(
+            last_message=message,
+            last_message_at=message.created_at,
+            buyer_unread=F('buyer_unread') + models.Case(
+                models.When(buyer_id=message.recipient_id, then=Value(1)), default=Value(0)
+            ),
+            seller_unread=F('seller_unread') + models.Case(
+                models.When(seller_id=message.recipient_id, then=Value(1)), default=Value(0)
+            ),
+        )
+
+    def recalculate_unread(self):
+        """Recompute the unread counters and last message from the messages in a single UPDATE."""
+        unread = Message.objects.filter(
+            conversation=OuterRef('pk'), is_read=False
+        ).order_by().values('conversation').annotate(count=models.Count('pk')).values('count')
+        last = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-pk')
+        return self.update(
+            buyer_unread=Coalesce(Subquery(unread.filter(recipient=OuterRef('buyer'))), Value(0)),
+            seller_unread=Coalesce(Subquery(unread.filter(recipient=OuterRef('seller'))), Value(0)),
+            last_message=Subquery(last.values('pk')[:1]),
+            last_message_at=Subquery(last.values('created_at')[:1]),
+        )
+
 class Conversation(models.Model):
+    MESSAGE_FIELDS = ('last_message', 'last_message_at', 'buyer_unread', 'seller_unread')
+
     product = models.ForeignKey(UserProduct, on_delete=models.CASCADE, related_name='conversations')
     buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='buyer_conversations')
     seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='seller_conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized by Message.save() and Conversation.mark_read()
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    buyer_unread = models.PositiveIntegerField(default=0)
+    seller_unread = models.PositiveIntegerField(default=0)
+
+    objects = ConversationQuerySet.as_manager()
 
     class Meta:
         unique_together = ['product', 'buyer']
+        indexes = [
+            models.Index(fields=['buyer', '-last_message_at'], name='conversation_buyer_last_idx'),
+            models.Index(fields=['seller', '-last_message_at'], name='conversation_seller_last_idx'),
+        ]
 
     def __str__(self):
         return f"Conversation about {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        # Never write the denormalized message state from memory; it is only changed by UPDATE
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MESSAGE_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def other_party(self, user):
+        return self.seller if user.pk == self.buyer_id else self.buyer
+
+    def unread_for(self, user):
+        return self.buyer_unread if user.pk == self.buyer_id else self.seller_unread
+
+    def recipient_for(self, sender_id):
+        return self.seller_id if sender_id == self.buyer_id else self.buyer_id
+
+    def mark_read(self, user):
+        """Mark the messages sent to ``user`` as read and lower their unread counter to match."""
+        counter = 'buyer_unread' if user.pk == self.buyer_id else 'seller_unread'
+        with transaction.atomic():
+            updated = Message.objects.filter(conversation=self, recipient=user, is_read=False).update(is_read=True)
+            if updated:
+                # Clamped: a counter that drifted low (e.g. messages marked read
+                # elsewhere) must not go negative on a PositiveIntegerField
+                Conversation.objects.filter(pk=self.pk).update(**{counter: Greatest(F(counter) - updated, 0)})
+        return updated
+
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='received_messages'
+    )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
@@ -310,8 +862,22 @@ class Message(models.Model):
     def __str__(self):
         return f"Message from {self.sender.username}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if self.recipient_id is None:
+            self.recipient_id = self.conversation.recipient_for(self.sender_id)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Conversation.objects.filter(pk=self.conversation_id).record_message(self)
+
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'is_read'], name='message_conv_read_idx'),
+            models.Index(fields=['conversation', 'created_at'], name='message_conv_created_idx'),
+            models.Index(fields=['recipient', 'is_read'], name='message_recipient_read_idx'),
+        ]
 
 class TelebirrPayment(models.Model):
     STATUS_CHOICES = (
@@ -336,6 +902,77 @@ class TelebirrPayment(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class PaymentNotification(models.Model):
+    """
+    Inbox of Telebirr payment webhooks, one row per ``outTradeNo``.
+
+    ``payment_notify`` only records the row; ``process_payment_notifications``
+    verifies the payment with the gateway and marks the order paid.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    out_trade_no = models.CharField(max_length=100, unique=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Failed for a reason a later notification can fix (e.g. the payment row
+    # did not exist yet), as opposed to a gateway rejection or exhausted retries
+    retryable = models.BooleanField(default=False)
+    received_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at'], name='paymentnotify_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Payment notification - {self.out_trade_no}"
+
+class ImageDerivative(models.Model):
+    """
+    Resized WebP/AVIF/JPEG copies of an uploaded image.
+
+    Files live under ``variants/<digest>/`` keyed by the SHA-256 of the
+    source, so identical uploads share one set and the URLs never change.
+    See ``mainapp.images``.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    widths = models.JSONField(default=list)
+    formats = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Image variants - {self.source}"
+
+
+class PendingImage(models.Model):
+    """
+    An uploaded image waiting for its variants.
+
+    Queued by ``mainapp.images.schedule_variants`` when no worker pool is
+    configured and drained by ``generate_image_variants --pending``.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['queued_at']
+
+    def __str__(self):
+        return f"Pending image variants - {self.source}"
+
 class Payment(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.module_loading import import_string
+from .models import Conversation
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def stream_supported(request):
+    """
+    Whether this request is served over ASGI, where the SSE stream is a
+    cheap coroutine. Under WSGI, StreamingHttpResponse drains the async
+    generator in the worker thread before sending anything, so the stream
+    would pin a thread forever and deliver nothing.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+class InProcessBroker:
+    """
+    Pub/sub between the threads of one process.
+
+    ``publish()`` may be called from sync code (views, signals); events are
+    handed to each subscriber's event loop with ``call_soon_threadsafe``.
+    Only reaches subscribers in the same process, so use RedisBroker when
+    running several workers.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, event)
+
+    @staticmethod
+    def _deliver(queue, event):
+        # A subscriber that stopped reading loses events rather than growing without bound
+        if not queue.full():
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisBroker:
+    """Pub/sub over Redis channels, so events reach subscribers in every process."""
+
+    prefix = 'mainapp:notifications:'
+
+    def __init__(self, url=None):
+        import redis
+
+        self.url = url or settings.NOTIFICATIONS_REDIS_URL
+        self._client = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, event):
+        self._client.publish(self.prefix + channel, json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.prefix + channel)
+        try:
+            yield _RedisSubscription(pubsub)
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return json.loads(message['data'])
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Return the broker named by ``settings.NOTIFICATIONS_BROKER``."""
+    return import_string(settings.NOTIFICATIONS_BROKER)()
+
+
+def user_channel(user_id):
+    return f'user.{user_id}'
+
+
+def publish_unread_count(user_id):
+    get_broker().publish(user_channel(user_id), {
+        'type': 'unread',
+        'count': Conversation.objects.unread_total(user_id),
+    })
+
+
+def message_payload(message):
+    """JSON-serializable form of a message, shared by the stream and the message endpoints."""
+    return {
+        'conversation': message.conversation_id,
+        'id': message.pk,
+        'sender': message.sender_id,
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+def publish_new_message(message):
+    """Send ``message`` to both participants' streams and push the recipient's new unread count."""
+    event = {'type': 'message', **message_payload(message)}
+    broker = get_broker()
+    for user_id in {message.sender_id, message.recipient_id}:
+        broker.publish(user_channel(user_id), event)
+    publish_unread_count(message.recipient_id)
+
+
+def format_event(event):
+    """Serialize an event as a Server-Sent Events frame."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
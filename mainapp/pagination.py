@@ -0,0 +1,155 @@
+import json
+from functools import cached_property
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+
+CURSOR_SALT = 'mainapp.pagination.cursor'
+APPROXIMATE_COUNT_CAP = 1000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over an ordered queryset.
+
+    ``ordering`` lists the sort fields (``'-created_at'``, ``'name'``, ...);
+    ``pk`` is appended as a tiebreaker so every row has a unique position.
+    Pages are fetched with ``WHERE (sort keys) > (last row)`` instead of
+    OFFSET, and no ``COUNT(*)`` is run unless ``count_mode`` asks for one.
+    """
+
+    count_cap = APPROXIMATE_COUNT_CAP
+
+    def __init__(self, queryset, ordering, per_page, count_mode=None):
+        self.ordering = [field for field in ordering if field.lstrip('-') not in ('pk', 'id')]
+        self.ordering.append('-pk' if self.ordering and self.ordering[-1].startswith('-') else 'pk')
+        self.queryset = queryset.order_by(*self.ordering)
+        self.per_page = per_page
+        self.count_mode = count_mode
+
+    def get_page(self, cursor=None):
+        """Return the page after/before ``cursor``; an invalid cursor gives the first page."""
+        try:
+            position = self._decode(cursor) if cursor else None
+        except InvalidCursor:
+            position = None
+
+        backwards = bool(position and position.get('direction') == 'previous')
+        ordering = [self._reverse(field) for field in self.ordering] if backwards else self.ordering
+        queryset = self.queryset.order_by(*ordering)
+        if position:
+            queryset = queryset.filter(self._after(ordering, position['values']))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self._encode(rows[-1], 'next')
+            if position and (has_more or not backwards):
+                previous_cursor = self._encode(rows[0], 'previous')
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    @cached_property
+    def count(self):
+        if self.count_mode == 'approximate':
+            return approximate_count(self.queryset)
+        if self.count_mode == 'exact':
+            return self.queryset.count()
+        return None
+
+    @cached_property
+    def count_is_capped(self):
+        """Whether ``count`` stopped at the cap: more than ``count_cap`` rows, exact number unknown."""
+        return (
+            self.count_mode == 'approximate' and connection.vendor != 'postgresql'
+            and self.count > self.count_cap
+        )
+
+    def _after(self, ordering, values):
+        # (a, b, pk) > (x, y, z)  ==  a > x OR (a = x AND (b > y OR (b = y AND pk > z)))
+        condition = Q()
+        for index in reversed(range(len(ordering))):
+            name = ordering[index].lstrip('-')
+            lookup = 'lt' if ordering[index].startswith('-') else 'gt'
+            beyond = Q(**{f'{name}__{lookup}': values[index]})
+            condition = beyond if index == len(ordering) - 1 else beyond | (Q(**{name: values[index]}) & condition)
+        return condition
+
+    def _encode(self, row, direction):
+        values = [self._value(row, field.lstrip('-')) for field in self.ordering]
+        return signing.dumps({'values': values, 'direction': direction}, salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, cursor):
+        try:
+            position = signing.loads(cursor, salt=CURSOR_SALT)
+            fields = [self._field(field.lstrip('-')) for field in self.ordering]
+            if len(position['values']) != len(fields):
+                raise InvalidCursor(cursor)
+            position['values'] = [field.to_python(value) for field, value in zip(fields, position['values'])]
+            return position
+        except (signing.BadSignature, KeyError, TypeError, ValueError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def _field(self, name):
+        return self.queryset.model._meta.pk if name == 'pk' else self.queryset.model._meta.get_field(name)
+
+    def _value(self, row, name):
+        value = getattr(row, self._field(name).attname)
+        return value if isinstance(value, (int, str)) else str(value)
+
+    @staticmethod
+    def _reverse(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def approximate_count(queryset):
+    """
+    Cheap row count for large listings.
+
+    Uses the planner estimate on PostgreSQL; elsewhere counts at most
+    APPROXIMATE_COUNT_CAP + 1 rows, so callers can show "1000+".
+    """
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.order_by()[:APPROXIMATE_COUNT_CAP + 1].count()
@@ -0,0 +1,61 @@
+import datetime
+import threading
+from functools import lru_cache
+import paypalrestsdk
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+class PayPalApi(paypalrestsdk.Api):
+    """
+    paypalrestsdk Api meant to live for the whole process.
+
+    Requests go through one pooled ``requests.Session`` with connect/read
+    timeouts, and the OAuth access token is reused until ``token_margin``
+    seconds before PayPal expires it. Token requests are serialized so
+    concurrent threads do not each fetch their own.
+    """
+
+    def __init__(self, options=None, timeout=(3.05, 15), pool_size=10, token_margin=60, **kwargs):
+        super().__init__(options, **kwargs)
+        self.timeout = timeout
+        self.token_margin = token_margin
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._token_lock = threading.Lock()
+
+    def http_call(self, url, method, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        response = self.session.request(method, url, proxies=self.proxies, **kwargs)
+        return self.handle_response(response, response.content.decode('utf-8'))
+
+    def get_token_hash(self, authorization_code=None, refresh_token=None, headers=None):
+        with self._token_lock:
+            return super().get_token_hash(authorization_code, refresh_token, headers)
+
+    def validate_token_hash(self):
+        # Refresh a little early so a token never expires between being read and being used
+        if self.token_request_at and self.token_hash and self.token_hash.get('expires_in') is not None:
+            age = (datetime.datetime.now() - self.token_request_at).total_seconds()
+            if age > self.token_hash['expires_in'] - self.token_margin:
+                self.token_hash = None
+
+
+@lru_cache(maxsize=None)
+def get_paypal_api():
+    """Return the process-wide PayPal Api, configured once from settings."""
+    options = {
+        'mode': settings.PAYPAL_MODE,
+        'client_id': settings.PAYPAL_CLIENT_ID,
+        'client_secret': settings.PAYPAL_SECRET_KEY,
+    }
+    if settings.PAYPAL_API_ENDPOINT:
+        options['endpoint'] = settings.PAYPAL_API_ENDPOINT
+    return PayPalApi(
+        options,
+        timeout=(settings.PAYPAL_CONNECT_TIMEOUT, settings.PAYPAL_READ_TIMEOUT),
+        pool_size=settings.PAYPAL_POOL_SIZE,
+    )
@@ -0,0 +1,197 @@
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import Product
+
+SEARCH_TABLE = 'mainapp_product_search'
+
+
+class BaseSearchBackend:
+    """
+    Full-text index over product name, description and category name.
+
+    ``search()`` filters a Product queryset and annotates it with
+    ``search_rank`` (higher is more relevant).
+    """
+
+    def ensure_index(self):
+        pass
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index(self, queryset):
+        """(Re)index the products in ``queryset``."""
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self):
+        self.ensure_index()
+        self.clear()
+        self.index(Product.objects.all())
+
+    def clear(self):
+        pass
+
+    def _document_sql(self, queryset):
+        return queryset.order_by().values_list(
+            'pk', 'name', 'description', 'category__name'
+        ).query.sql_with_params()
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Unindexed fallback using LIKE lookups, for databases without full-text support."""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 virtual table keyed by product id, ranked with bm25()."""
+
+    def ensure_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                f"USING fts5(name, description, category, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def search(self, queryset, query):
+        match = self._match_expression(query)
+        if not match:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        pk = f'{Product._meta.db_table}.id'
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match])
+        ).annotate(
+            # bm25() weights: name, description, category; negated so higher is better
+            search_rank=RawSQL(
+                f"SELECT -bm25({SEARCH_TABLE}, 10.0, 2.0, 5.0) FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {pk}",
+                [match],
+                output_field=FloatField()
+            )
+        )
+
+    def index(self, queryset):
+        sql, params = self._document_sql(queryset)
+        with connection.cursor() as cursor:
+            # FTS5 tables have no upsert; replace the rows for these products
+            self._delete(cursor, queryset)
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, category) {sql}",
+                params
+            )
+
+    def _delete(self, cursor, queryset):
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({sql})", params)
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    @staticmethod
+    def _match_expression(query):
+        # Quote every term so user input cannot inject FTS5 syntax; prefix-match each
+        terms = re.findall(r'\w+', query)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector side table with a GIN index, ranked with ts_rank()."""
+
+    config = 'english'
+
+    def ensure_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                f"product_id bigint PRIMARY KEY REFERENCES {Product._meta.db_table}(id) "
+                f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_gin "
+                f"ON {SEARCH_TABLE} USING GIN (document)"
+            )
+
+    def search(self, queryset, query):
+        pk = f'{Product._meta.db_table}.id'
+        tsquery = f"websearch_to_tsquery('{self.config}', %s)"
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT product_id FROM {SEARCH_TABLE} WHERE document @@ {tsquery}", [query])
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT ts_rank(document, {tsquery}) FROM {SEARCH_TABLE} WHERE product_id = {pk}",
+                [query],
+                output_field=FloatField()
+            )
+        )
+
+    def index(self, queryset):
+        from django.contrib.postgres.search import SearchVector
+
+        document = (
+            SearchVector('name', weight='A', config=self.config) +
+            SearchVector('description', weight='B', config=self.config) +
+            SearchVector('category__name', weight='C', config=self.config)
+        )
+        sql, params = queryset.order_by().annotate(
+            document=document
+        ).values_list('pk', 'document').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) {sql} "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                params
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE product_id = ANY(%s)", [product_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    Return the configured search backend.
+
+    ``settings.SEARCH_BACKEND`` may name a backend class; otherwise one is
+    picked from the database vendor.
+    """
+    backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return VENDOR_BACKENDS.get(connection.vendor, SimpleSearchBackend)()
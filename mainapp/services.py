@@ -1,30 +1,46 @@
-import requests
 import json
 import base64
 import hashlib
 import time
 import uuid
 import logging
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_v1_5
-from .models import Payment, TelebirrPayment
+from .models import Payment, PaymentNotification, TelebirrPayment, Order, OrderItem, Product
+from .telebirr import GatewayUnavailable, get_telebirr_client
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=8)
+def _rsa_cipher(public_key):
+    """Parse a PEM public key once per process; the PKCS#1 v1.5 cipher is stateless and reusable."""
+    return PKCS1_v1_5.new(RSA.importKey(public_key))
+
+
 class TelebirrPaymentService:
-    def __init__(self):
+    def __init__(self, client=None):
         self.api_key = settings.TELEBIRR_API_KEY
         self.api_secret = settings.TELEBIRR_API_SECRET
         self.api_url = settings.TELEBIRR_API_URL
         self.notify_url = settings.TELEBIRR_NOTIFY_URL
         self.return_url = settings.TELEBIRR_RETURN_URL
+        self.app_id = settings.TELEBIRR_APP_ID
+        self.app_key = settings.TELEBIRR_APP_KEY
+        self.public_key = settings.TELEBIRR_PUBLIC_KEY
+        self.client = client or get_telebirr_client()
 
     def _encrypt(self, data):
         """Encrypt data using RSA public key"""
         try:
-            key = RSA.importKey(self.public_key)
-            cipher = PKCS1_v1_5.new(key)
+            cipher = _rsa_cipher(self.public_key)
             encrypted = cipher.encrypt(data.encode())
             return base64.b64encode(encrypted).decode()
         except Exception as e:
@@ -78,12 +94,8 @@ class TelebirrPaymentService:
                 "data": encoded_data
             }
 
-            # Make API request
-            response = requests.post(
-                self.api_url,
-                json=request_data,
-                headers={'Content-Type': 'application/json'}
-            )
+            # Make API request; only retried if the connection could not be made
+            response = self.client.post('', request_data)
 
             if response.status_code == 200:
                 result = response.json()
@@ -110,9 +122,17 @@ class TelebirrPaymentService:
                 'error': str(e)
             }
 
-    def verify_payment(self, transaction_id):
+    def verify_payment(self, transaction_id, payment=None, save=True):
+        """
+        Ask the gateway whether the payment went through and store the result.
+
+        ``retry`` is set in the result when the gateway could not give an
+        answer, so callers can try again later. With ``save=False`` only the
+        in-memory ``payment.status`` is changed, for callers that write in bulk.
+        """
         try:
-            payment = TelebirrPayment.objects.get(transaction_id=transaction_id)
+            if payment is None:
+                payment = TelebirrPayment.objects.get(transaction_id=transaction_id)
             
             # Prepare verification data
             verify_data = {
@@ -120,25 +140,23 @@ class TelebirrPaymentService:
                 "appId": self.api_key
             }
 
-            # Make API request to verify payment
-            response = requests.post(
-                f"{self.api_url}/verify",
-                json=verify_data,
-                headers={'Content-Type': 'application/json'}
-            )
+            # Make API request to verify payment; verification is safe to retry
+            response = self.client.post('verify', verify_data, idempotent=True)
 
             if response.status_code == 200:
                 result = response.json()
                 if result.get('success'):
                     payment.status = 'completed'
-                    payment.save()
+                    if save:
+                        payment.save()
                     return {
                         'success': True,
                         'status': 'completed'
                     }
                 else:
                     payment.status = 'failed'
-                    payment.save()
+                    if save:
+                        payment.save()
                     return {
                         'success': False,
                         'error': result.get('message', 'Payment verification failed')
@@ -146,7 +164,8 @@ class TelebirrPaymentService:
             else:
                 return {
                     'success': False,
-                    'error': f'API request failed with status code: {response.status_code}'
+                    'error': f'API request failed with status code: {response.status_code}',
+                    'retry': True
                 }
 
         except TelebirrPayment.DoesNotExist:
@@ -154,8 +173,152 @@ class TelebirrPaymentService:
                 'success': False,
                 'error': 'Payment not found'
             }
+        except GatewayUnavailable as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'retry': True
+            }
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
-            } 
\ No newline at end of file
+            }
+
+
+@lru_cache(maxsize=None)
+def get_telebirr_service():
+    """Shared service instance, so every request reuses the pooled gateway client."""
+    return TelebirrPaymentService()
+
+
+class PaymentNotificationProcessor:
+    """
+    Works through the payment webhook inbox: verifies each recorded
+    notification with the gateway and marks its order paid exactly once.
+    """
+
+    def __init__(self, service=None, max_attempts=5, stale_after=timedelta(minutes=5)):
+        self.service = service or get_telebirr_service()
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+
+    def claim(self, batch_size):
+        """Take up to ``batch_size`` pending notifications, plus any abandoned by a crashed worker."""
+        claimable = Q(status='pending') | Q(
+            status='processing', updated_at__lt=timezone.now() - self.stale_after
+        )
+        with transaction.atomic():
+            ids = list(
+                PaymentNotification.objects.select_for_update(skip_locked=True)
+                .filter(claimable).order_by('received_at').values_list('pk', flat=True)[:batch_size]
+            )
+            PaymentNotification.objects.filter(pk__in=ids).update(
+                status='processing', attempts=F('attempts') + 1, updated_at=timezone.now()
+            )
+        return list(PaymentNotification.objects.filter(pk__in=ids).order_by('received_at'))
+
+    def process_batch(self, batch_size=50):
+        """Process one batch and return a Counter of outcomes (done/pending/failed)."""
+        notifications = self.claim(batch_size)
+        payments = TelebirrPayment.objects.in_bulk(
+            [notification.out_trade_no for notification in notifications], field_name='transaction_id'
+        )
+        outcomes = Counter()
+        for notification in notifications:
+            outcomes[self.process(notification, payments.get(notification.out_trade_no))] += 1
+        return outcomes
+
+    def process(self, notification, payment):
+        if payment is None:
+            # Possibly a notification racing the checkout; a repeat may succeed
+            return self._finish(notification, 'failed', 'Payment not found', retryable=True)
+        result = self.service.verify_payment(notification.out_trade_no, payment=payment)
+        if result.get('retry'):
+            status = 'failed' if notification.attempts >= self.max_attempts else 'pending'
+            return self._finish(notification, status, result['error'])
+        if not result['success']:
+            return self._finish(notification, 'failed', result['error'])
+        self.mark_order_paid(payment.order_id)
+        return self._finish(notification, 'done')
+
+    @staticmethod
+    def mark_order_paid(order_id):
+        """Flip the order to paid; returns False if it already was."""
+        return bool(Order.objects.filter(pk=order_id).mark_paid())
+
+    @staticmethod
+    def _finish(notification, status, error='', retryable=False):
+        notification.status = status
+        notification.last_error = error
+        notification.retryable = retryable
+        if status != 'pending':
+            notification.processed_at = timezone.now()
+        notification.save(update_fields=['status', 'last_error', 'retryable', 'processed_at', 'updated_at'])
+        return status
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, product, requested):
+        self.product = product
+        self.requested = requested
+        super().__init__(f"Not enough stock for {product.name} (requested {requested})")
+
+
+class OrderPlacementService:
+    shipping_cost = Decimal('10.00')
+
+    def place_order(self, cart, **details):
+        """
+        Turn the cart into an order in one transaction.
+
+        Stock is reserved with one conditional UPDATE per product, so an
+        oversell raises InsufficientStockError and rolls everything back.
+        """
+        with transaction.atomic():
+            items = list(cart.items.select_related('product').order_by('product_id'))
+            if not items:
+                raise ValueError('Cart is empty')
+
+            quantities = {}
+            for item in items:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + int(item.quantity)
+
+            for product_id, quantity in quantities.items():
+                reserved = Product.objects.filter(
+                    pk=product_id,
+                    stock__gte=quantity
+                ).update(stock=F('stock') - quantity)
+                if not reserved:
+                    product = next(item.product for item in items if item.product_id == product_id)
+                    raise InsufficientStockError(product, quantity)
+
+            subtotal = sum((item.get_cost() for item in items), Decimal('0'))
+            discount = Decimal('0')
+            if cart.coupon_id:
+                discount = (subtotal * Decimal(cart.coupon.discount) / Decimal('100')).quantize(Decimal('0.01'))
+
+            order = Order.objects.create(
+                user_id=cart.user_id,
+                subtotal=subtotal,
+                discount=discount,
+                shipping_cost=self.shipping_cost,
+                total=subtotal - discount + self.shipping_cost,
+                item_count=sum(quantities.values()),
+                items_summary=Order.describe_items(items),
+                **details
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    price=item.product.price,
+                    quantity=item.quantity
+                )
+                for item in items
+            ])
+
+            cart.clear()
+            cart.coupon = None
+            cart.save()
+        return order
@@ -0,0 +1,129 @@
+from functools import partial
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import Cart, Category, Coupon, Message, Product, ProductReview
+from .caching import invalidate_catalog
+from .cart import merge_session_cart
+from .images import IMAGE_FIELDS, schedule_variants
+from .notifications import publish_new_message
+from .search import get_search_backend
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    if sender.name == 'mainapp':
+        get_search_backend().ensure_index()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    # Products carry the category name in their search document
+    if not created and not raw:
+        get_search_backend().index(Product.objects.filter(category=instance))
+
+
+@receiver(pre_save, sender=ProductReview)
+def load_previous_rating(sender, instance, raw=False, **kwargs):
+    # Instances not loaded from the database (e.g. ProductReview(pk=...))
+    # may still overwrite an existing review; read what is being replaced
+    if raw or hasattr(instance, '_loaded_values') or instance.pk is None:
+        return
+    previous = ProductReview.objects.filter(pk=instance.pk).values('product_id', 'rating').first()
+    instance._loaded_values = previous or {}
+
+
+@receiver(post_save, sender=ProductReview)
+def update_product_rating(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if created:
+        Product.objects.filter(pk=instance.product_id).apply_rating_delta(added=instance.rating)
+    elif loaded.get('product_id') != instance.product_id:
+        Product.objects.filter(pk=loaded.get('product_id')).apply_rating_delta(removed=loaded.get('rating'))
+        Product.objects.filter(pk=instance.product_id).apply_rating_delta(added=instance.rating)
+    elif loaded.get('rating') != instance.rating:
+        Product.objects.filter(pk=instance.product_id).apply_rating_delta(
+            added=instance.rating,
+            removed=loaded.get('rating')
+        )
+    instance._loaded_values = {'product_id': instance.product_id, 'rating': instance.rating}
+
+
+@receiver(post_delete, sender=ProductReview)
+def remove_product_rating(sender, instance, **kwargs):
+    rating = getattr(instance, '_loaded_values', {}).get('rating', instance.rating)
+    Product.objects.filter(pk=instance.product_id).apply_rating_delta(removed=rating)
+
+
+# Cart totals are kept by CartItem.save()/delete() and Cart.save(), which do not
+# run when a product or coupon deletion cascades into carts. Note the affected
+# carts before the delete and recompute them once it is done.
+@receiver(pre_delete, sender=Product)
+def collect_product_carts(sender, instance, **kwargs):
+    instance._affected_cart_ids = list(
+        Cart.objects.filter(items__product=instance).values_list('pk', flat=True).distinct()
+    )
+
+
+@receiver(pre_delete, sender=Coupon)
+def collect_coupon_carts(sender, instance, **kwargs):
+    instance._affected_cart_ids = list(Cart.objects.filter(coupon=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Coupon)
+def recalculate_affected_carts(sender, instance, **kwargs):
+    cart_ids = getattr(instance, '_affected_cart_ids', None)
+    if cart_ids:
+        Cart.objects.filter(pk__in=cart_ids).recalculate_totals()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def invalidate_catalog_fragments(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_catalog()
+
+
+@receiver(post_save, sender=Message)
+def notify_new_message(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(partial(publish_new_message, instance))
+
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        merge_session_cart(request, user)
+
+
+def generate_image_variants(sender, instance, field_name, raw=False, **kwargs):
+    # Already-processed files are skipped by the worker, so re-saving a row is cheap
+    name = getattr(instance, field_name).name
+    if name and not raw:
+        transaction.on_commit(partial(schedule_variants, name))
+
+
+for model, field_name in IMAGE_FIELDS:
+    post_save.connect(
+        partial(generate_image_variants, field_name=field_name),
+        sender=model, weak=False, dispatch_uid=f'image_variants:{model.__name__}',
+    )
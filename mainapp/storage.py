@@ -0,0 +1,22 @@
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from .assets import compress_file
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Fingerprints collected files and writes precompressed siblings.
+
+    After ``collectstatic`` every hashed file gets ``.gz`` (and ``.br`` when
+    brotli is installed) next to it, which ``serve_asset`` hands to clients
+    that accept them.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if not dry_run:
+            for hashed_name in hashed_names:
+                compress_file(self.path(hashed_name))
@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+import logging
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {502, 503, 504}
+
+
+class GatewayUnavailable(Exception):
+    pass
+
+
+class CircuitOpenError(GatewayUnavailable):
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+        super().__init__(f"Payment gateway is unavailable, retrying in {retry_in:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Fails fast after ``failure_threshold`` consecutive failures.
+
+    Once ``reset_timeout`` seconds have passed a single trial call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            waited = self.clock() - self.opened_at
+            if waited < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError(max(self.reset_timeout - waited, 0))
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+
+class TelebirrClient:
+    """
+    Long-lived HTTP client for the Telebirr gateway.
+
+    Keeps a pooled ``requests.Session``, bounds every call with connect/read
+    timeouts, retries transient failures with jittered exponential backoff,
+    and trips a circuit breaker when the gateway keeps failing.
+    """
+
+    def __init__(self, base_url, timeout=(3.05, 10), max_retries=2, backoff=0.3,
+                 pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Content-Type'] = 'application/json'
+
+    def post(self, path, payload, idempotent=False):
+        """
+        POST ``payload`` as JSON and return the response.
+
+        Connection failures are always retried, since the request never
+        reached the gateway. Read timeouts and 502/503/504 responses are only
+        retried when ``idempotent`` is set.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}" if path else self.base_url
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                retryable = idempotent or not isinstance(e, requests.ReadTimeout)
+                if not retryable or attempt >= self.max_retries:
+                    raise GatewayUnavailable(str(e)) from e
+            else:
+                # Any 5xx means the gateway is failing, even those not worth retrying
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if response.status_code not in RETRY_STATUSES or not idempotent or attempt >= self.max_retries:
+                    return response
+            attempt += 1
+            delay = self._backoff_delay(attempt)
+            logger.warning(f"Telebirr request to {url} failed, retry {attempt} in {delay:.2f}s")
+            time.sleep(delay)
+
+    def _backoff_delay(self, attempt):
+        # Full jitter: spreads retries from many workers instead of having them arrive together
+        return random.uniform(0, self.backoff * 2 ** (attempt - 1))
+
+
+@lru_cache(maxsize=None)
+def get_telebirr_client():
+    """Return the process-wide Telebirr client, configured from settings."""
+    return TelebirrClient(
+        settings.TELEBIRR_API_URL,
+        timeout=(settings.TELEBIRR_CONNECT_TIMEOUT, settings.TELEBIRR_READ_TIMEOUT),
+        max_retries=settings.TELEBIRR_MAX_RETRIES,
+        backoff=settings.TELEBIRR_RETRY_BACKOFF,
+        pool_size=settings.TELEBIRR_POOL_SIZE,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.TELEBIRR_CIRCUIT_FAILURES,
+            reset_timeout=settings.TELEBIRR_CIRCUIT_RESET,
+        ),
+    )
@@ -0,0 +1,26 @@
+from django import template
+from django.utils.html import format_html
+from ..assets import asset_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset(path):
+    """
+    Link a stylesheet or script from static/ by its fingerprinted URL.
+
+    Usage::
+
+        {% asset "css/base.css" %}
+        {% asset "js/base.js" %}
+
+    With the manifest storage the URL changes whenever the file does, so
+    ``serve_asset`` can let browsers cache it for a year.
+    """
+    url = asset_url(path)
+    if path.endswith('.css'):
+        return format_html('<link rel="stylesheet" href="{}">', url)
+    if path.endswith('.js'):
+        return format_html('<script src="{}"></script>', url)
+    raise template.TemplateSyntaxError(f"'asset' cannot link '{path}'; use {{% static %}} instead.")
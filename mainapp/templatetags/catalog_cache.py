@@ -0,0 +1,59 @@
+from django import template
+from django.conf import settings
+from ..caching import PENDING_IMAGES_KEY, get_catalog_cache, make_fragment_key
+
+register = template.Library()
+
+
+class CatalogFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        cache = get_catalog_cache()
+        key = make_fragment_key(
+            self.name.resolve(context),
+            [value.resolve(context) for value in self.vary_on]
+        )
+        content = cache.get(key)
+        if content is None:
+            pending = []
+            with context.push({PENDING_IMAGES_KEY: pending}):
+                content = self.nodelist.render(context)
+            timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600)
+            if pending:
+                # Variants generated by another process only bump the catalog
+                # version when the catalog cache is shared, so fragments still
+                # showing original images expire on their own.
+                outer = context.get(PENDING_IMAGES_KEY)
+                if outer is not None:
+                    outer.extend(pending)
+                timeout = min(timeout, getattr(settings, 'CATALOG_CACHE_PENDING_TIMEOUT', 60))
+            cache.set(key, content, timeout)
+        return content
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Cache a catalog fragment until the catalog changes.
+
+    Usage::
+
+        {% cachefragment "name" [vary_on ...] %} ... {% endcachefragment %}
+
+    Only put content in here that is the same for every visitor; the cart
+    badge and anything else per-user must stay outside.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CatalogFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]]
+    )
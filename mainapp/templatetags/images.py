@@ -0,0 +1,81 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+from ..caching import PENDING_IMAGES_KEY
+from ..images import MIME_TYPES, get_variants, get_variants_many, variant_url
+
+register = template.Library()
+
+DEFAULT_SIZES = '100vw'
+# Width of the JPEG used as <img src> by browsers without srcset support
+FALLBACK_WIDTH = 640
+PREFETCHED_KEY = 'images:prefetched_variants'
+
+
+def _srcset(manifest, fmt):
+    return ', '.join(
+        f"{variant_url(manifest['digest'], width, fmt)} {width}w" for width in manifest['widths']
+    )
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_image_variants(context, objects, field='image'):
+    """
+    Look up the variants of a whole grid before rendering it.
+
+    Usage::
+
+        {% prefetch_image_variants products %}
+        {% for product in products %}{% responsive_image product.image %}{% endfor %}
+
+    The ``responsive_image`` tags that follow in the same render reuse the
+    result instead of looking up each image on its own.
+    """
+    names = [image.name for image in (getattr(obj, field) for obj in objects) if image]
+    prefetched = context.render_context.setdefault(PREFETCHED_KEY, {})
+    prefetched.update(get_variants_many(names))
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def responsive_image(context, image, sizes=DEFAULT_SIZES, alt='', lazy=True, **attrs):
+    """
+    Render an uploaded image as a ``<picture>`` with AVIF/WebP/JPEG srcsets.
+
+    Usage::
+
+        {% responsive_image product.image sizes="(min-width: 992px) 25vw, 50vw" alt=product.name class="card-img-top" %}
+
+    ``sizes`` should describe the rendered width so the browser can pick the
+    smallest variant. Falls back to the original file until its variants
+    have been generated. Extra keyword arguments become ``<img>`` attributes.
+    """
+    if not image:
+        return ''
+    attrs = {'alt': alt, **attrs}
+    if lazy:
+        attrs.update(loading='lazy', decoding='async')
+
+    prefetched = context.render_context.get(PREFETCHED_KEY, {})
+    manifest = prefetched[image.name] if image.name in prefetched else get_variants(image.name)
+    if manifest is None:
+        pending = context.get(PENDING_IMAGES_KEY)
+        if pending is not None:
+            pending.append(image.name)
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    fallback = max((width for width in manifest['widths'] if width <= FALLBACK_WIDTH), default=manifest['widths'][0])
+    attrs.update(
+        srcset=_srcset(manifest, 'jpeg'),
+        sizes=sizes,
+        width=manifest['width'],
+        height=manifest['height'],
+    )
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], _srcset(manifest, fmt), sizes) for fmt in manifest['formats'] if fmt != 'jpeg')
+    )
+    return format_html(
+        '<picture>{}<img src="{}"{}></picture>',
+        sources, variant_url(manifest['digest'], fallback, 'jpeg'), flatatt(attrs)
+    )
@@ -1,3 +1,1521 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import os
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import paypalrestsdk
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from Crypto.PublicKey import RSA
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncRequestFactory, TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.utils import timezone
+from PIL import Image
 
-# Create your tests here.
+from .assets import VENDOR_ASSETS, asset_url, clear_asset_urls, vendor_assets
+from .caching import get_catalog_cache
+from .checks import check_vendored_assets
+from .cart import get_session_cart, get_session_quantities, merge_session_cart, save_session_cart
+from .context_processors import cart as cart_context
+from .images import generate_variants, get_variants, get_variants_many, process_pending, variant_path
+from .management.commands.mock_paypal_api import make_server as make_paypal_server
+from .management.commands.mock_telebirr_gateway import make_server
+from .models import (
+    Cart, CartItem, Category, Conversation, Coupon, CustomUser, DailySalesRollup, ImageDerivative, Message, Order,
+    OrderItem, PaymentNotification, PendingImage, Product, ProductReview, TelebirrPayment, UserProduct
+)
+from .notifications import InProcessBroker
+from .pagination import KeysetPage, KeysetPaginator
+from .paypal import PayPalApi
+from .search import get_search_backend
+from .services import (
+    InsufficientStockError, OrderPlacementService, PaymentNotificationProcessor, TelebirrPaymentService,
+    _rsa_cipher
+)
+from .telebirr import CircuitBreaker, CircuitOpenError, GatewayUnavailable, TelebirrClient
+from .views import MESSAGES_PER_PAGE, message_stream
+
+
+def make_product(category, index, price='10.00'):
+    return Product.objects.create(
+        category=category,
+        name=f'Product {index}',
+        slug=f'product-{index}',
+        description='Test product',
+        price=Decimal(price),
+        image='products/test.png',
+        stock=10
+    )
+
+
+class SessionCartPricingTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.products = [make_product(self.category, i) for i in range(15)]
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+        self.request.session = SessionStore()
+        self.request.session['cart'] = {
+            str(product.id): {'quantity': 2, 'price': str(product.price)}
+            for product in self.products
+        }
+
+    def test_pricing_uses_single_query(self):
+        with self.assertNumQueries(1):
+            session_cart = get_session_cart(self.request)
+        self.assertEqual(len(session_cart), 15)
+        self.assertEqual(session_cart.count, 30)
+        self.assertEqual(session_cart.total, Decimal('300.00'))
+
+    def test_pricing_is_memoized_per_request(self):
+        with self.assertNumQueries(1):
+            get_session_cart(self.request)
+            context = cart_context(self.request)
+        self.assertEqual(context['cart_count'], 30)
+        self.assertEqual(context['cart_total'], Decimal('300.00'))
+
+    def test_save_resets_memoized_pricing(self):
+        get_session_cart(self.request)
+        cart = self.request.session['cart']
+        del cart[str(self.products[0].id)]
+        save_session_cart(self.request, cart)
+        with self.assertNumQueries(1):
+            session_cart = get_session_cart(self.request)
+        self.assertEqual(session_cart.total, Decimal('280.00'))
+
+    def test_missing_products_are_skipped(self):
+        self.products[0].delete()
+        session_cart = get_session_cart(self.request)
+        self.assertEqual(len(session_cart), 14)
+        self.assertEqual(session_cart.count, 28)
+        self.assertEqual(session_cart.total, Decimal('280.00'))
+
+    def test_saved_cart_stores_only_quantities(self):
+        quantities = get_session_quantities(self.request)
+        self.assertEqual(quantities[self.products[0].id], 2)
+        save_session_cart(self.request, quantities)
+        stored = self.request.session['cart']
+        self.assertEqual(stored['v'], 1)
+        self.assertEqual(stored['items'][str(self.products[0].id)], 2)
+        self.assertEqual(get_session_cart(self.request).total, Decimal('300.00'))
+
+    def test_guest_cart_views_write_compact_cart(self):
+        product = self.products[0]
+        self.client.post('/cart/add/', {'product_id': product.id, 'quantity': 1})
+        response = self.client.post('/cart/update/', json.dumps({'product_id': product.id, 'quantity': 4}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['total'], '40.00')
+        self.assertEqual(self.client.session['cart'], {'v': 1, 'items': {str(product.id): 4}})
+        self.client.post('/cart/remove/', {'product_id': product.id})
+        self.assertEqual(self.client.session['cart'], {'v': 1, 'items': {}})
+
+    def test_guest_update_rejects_unknown_products(self):
+        response = self.client.post('/cart/update/', json.dumps({'product_id': 999999, 'quantity': 2}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('cart', self.client.session)
+
+
+class GuestCartMergeTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.products = [make_product(self.category, i) for i in range(12)]
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=3)
+
+    def guest_request(self, quantities):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        save_session_cart(request, {product.id: quantity for product, quantity in quantities})
+        return request
+
+    def test_login_merges_guest_cart(self):
+        session = self.client.session
+        session['cart'] = {'v': 1, 'items': {str(self.products[0].id): 2, str(self.products[1].id): 1}}
+        session.save()
+        self.client.login(email='buyer@example.com', password='pass')
+        quantities = dict(self.cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.products[0].id: 5, self.products[1].id: 1})
+        self.cart.refresh_totals()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (6, Decimal('60.00')))
+        self.assertNotIn('cart', self.client.session)
+
+    def test_merge_policy_resolves_conflicts(self):
+        request = self.guest_request([(self.products[0], 2)])
+        merge_session_cart(request, self.user, policy='max')
+        self.assertEqual(self.cart.items.get().quantity, 3)
+        request = self.guest_request([(self.products[0], 2)])
+        merge_session_cart(request, self.user, policy='guest')
+        self.assertEqual(self.cart.items.get().quantity, 2)
+
+    def test_merge_query_count_does_not_grow_with_cart_size(self):
+        counts = []
+        for products in (self.products[:2], self.products):
+            request = self.guest_request([(product, 1) for product in products])
+            with CaptureQueriesContext(connection) as queries:
+                merge_session_cart(request, self.user)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(self.cart.items.count(), 12)
+
+
+class SessionCleanupTests(TestCase):
+    def test_purge_deletes_only_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(5)]
+            + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))]
+        )
+        out = StringIO()
+        with self.assertNumQueries(7):
+            call_command('purge_expired_sessions', batch_size=2, stdout=out)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertIn('Deleted 5 expired sessions', out.getvalue())
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.first = make_product(self.category, 1, price='10.00')
+        self.second = make_product(self.category, 2, price='2.50')
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def assertTotals(self, item_count, subtotal, discount):
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, item_count)
+        self.assertEqual(self.cart.subtotal, Decimal(subtotal))
+        self.assertEqual(self.cart.discount, Decimal(discount))
+
+    def test_totals_follow_item_changes(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.first, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.second, quantity=1)
+        self.assertTotals(3, '22.50', '0.00')
+
+        item = CartItem.objects.get(pk=item.pk)
+        item.quantity = 3
+        item.save()
+        self.assertTotals(4, '32.50', '0.00')
+
+        item.delete()
+        self.assertTotals(1, '2.50', '0.00')
+
+    def test_coupon_updates_discount(self):
+        CartItem.objects.create(cart=self.cart, product=self.first, quantity=3)
+        now = timezone.now()
+        self.cart.coupon = Coupon.objects.create(
+            code='TEN', discount=10, valid_from=now, valid_to=now + timedelta(days=1)
+        )
+        self.cart.save()
+        self.assertEqual(self.cart.get_discount(), Decimal('3.00'))
+        self.assertEqual(self.cart.get_total(), Decimal('27.00'))
+
+        CartItem.objects.create(cart=self.cart, product=self.second, quantity=4)
+        self.assertTotals(7, '40.00', '4.00')
+
+    def test_price_change_and_reconcile(self):
+        CartItem.objects.create(cart=self.cart, product=self.first, quantity=2)
+        self.first.price = Decimal('12.00')
+        self.first.save()
+        self.assertTotals(2, '24.00', '0.00')
+
+        Cart.objects.filter(pk=self.cart.pk).update(item_count=9, subtotal=0)
+        call_command('reconcile_cart_totals', stdout=StringIO())
+        self.assertTotals(2, '24.00', '0.00')
+
+    def test_clear_resets_totals(self):
+        CartItem.objects.create(cart=self.cart, product=self.first, quantity=2)
+        self.cart.clear()
+        self.assertTotals(0, '0.00', '0.00')
+        self.assertFalse(self.cart.items.exists())
+
+    def test_product_deletion_updates_carts(self):
+        CartItem.objects.create(cart=self.cart, product=self.first, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.second, quantity=2)
+        self.first.delete()
+        self.assertTotals(2, '5.00', '0.00')
+
+        self.second.delete()
+        self.assertTotals(0, '0.00', '0.00')
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.get('/checkout/'), '/cart/')
+
+    def test_coupon_deletion_drops_discount(self):
+        CartItem.objects.create(cart=self.cart, product=self.first, quantity=3)
+        now = timezone.now()
+        self.cart.coupon = Coupon.objects.create(
+            code='TEN', discount=10, valid_from=now, valid_to=now + timedelta(days=1)
+        )
+        self.cart.save()
+        self.assertTotals(3, '30.00', '3.00')
+        self.cart.coupon.delete()
+        self.assertTotals(3, '30.00', '0.00')
+
+
+class CartMutationTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.first = make_product(self.category, 1, price='10.00')
+        self.second = make_product(self.category, 2, price='2.50')
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        self.carts = Cart.objects.filter(user=self.user)
+
+    def statements(self, queries):
+        return [q['sql'] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+    def test_cart_is_unique_per_product(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.first)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(cart=cart, product=self.first)
+
+    def test_one_cart_per_user(self):
+        Cart.objects.create(user=self.user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user)
+
+    def test_mutations_return_fresh_totals_in_three_statements(self):
+        # The mutation, the recalculating UPDATE and reading the totals back
+        Cart.objects.create(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.carts.add_item(self.first.id, 2))
+            totals = self.carts.totals()
+        self.assertEqual(len(self.statements(queries)), 3)
+        self.assertEqual(totals, {'item_count': 2, 'subtotal': Decimal('20.00'),
+                                  'discount': Decimal('0.00'), 'total': Decimal('20.00')})
+
+        self.assertFalse(self.carts.add_item(self.first.id, 5))
+        self.assertTrue(self.carts.add_item(self.second.id, 1))
+        item = CartItem.objects.get(product=self.second)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.carts.update_item(item.id, 4), Decimal('10.00'))
+            totals = self.carts.totals()
+        self.assertEqual(len(self.statements(queries)), 4)
+        self.assertEqual((totals['item_count'], totals['total']), (6, Decimal('30.00')))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.carts.remove_item(item_id=item.id))
+            totals = self.carts.totals()
+        self.assertEqual(len(self.statements(queries)), 3)
+        self.assertEqual((totals['item_count'], totals['total']), (2, Decimal('20.00')))
+
+    def test_mutations_do_not_touch_other_users_carts(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='pass')
+        item = CartItem.objects.create(cart=Cart.objects.create(user=other), product=self.first)
+        Cart.objects.create(user=self.user)
+        self.assertIsNone(self.carts.update_item(item.id, 9))
+        self.assertFalse(self.carts.remove_item(item_id=item.id))
+        self.assertEqual(CartItem.objects.get(pk=item.pk).quantity, 1)
+
+    def test_cart_add_view_creates_cart_on_first_add(self):
+        self.client.force_login(self.user)
+        response = self.client.post('/cart/add/', {'product_id': self.first.id, 'quantity': 2})
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual(response.json()['total'], '20.00')
+        response = self.client.post('/cart/add/', {'product_id': self.first.id})
+        self.assertEqual(response.json()['status'], 'exists')
+        self.assertEqual(response.json()['cart_count'], 2)
+        self.assertEqual(self.carts.get().items.count(), 1)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.products = [make_product(self.category, i, price='2.00') for i in range(6)]
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+
+    def post(self, operations):
+        return self.client.post('/cart/batch/', json.dumps({'operations': operations}), content_type='application/json')
+
+    def statements(self, queries):
+        return [q['sql'] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+    def test_query_count_does_not_grow_with_operations(self):
+        self.client.force_login(self.user)
+        self.post([{'op': 'add', 'product_id': self.products[0].id}])
+        counts = []
+        for size in (2, 6):
+            operations = [{'op': 'update', 'product_id': p.id, 'quantity': size} for p in self.products[:size]]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post(operations)
+            counts.append(len(self.statements(queries)))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(response.json()['cart_count'], 36)
+        self.assertEqual(response.json()['total'], '72.00')
+
+    def test_operations_apply_in_order(self):
+        self.client.force_login(self.user)
+        first, second = self.products[:2]
+        response = self.post([
+            {'op': 'add', 'product_id': first.id, 'quantity': 2},
+            {'op': 'add', 'product_id': first.id},
+            {'op': 'add', 'product_id': second.id},
+            {'op': 'remove', 'product_id': second.id},
+        ])
+        self.assertEqual(response.json()['items'], {str(first.id): 3, str(second.id): 0})
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(list(cart.items.values_list('product_id', 'quantity')), [(first.id, 3)])
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, Decimal('6.00'))
+
+        response = self.post([{'op': 'update', 'product_id': first.id, 'quantity': 0}])
+        self.assertEqual(response.json()['cart_count'], 0)
+        self.assertFalse(cart.items.exists())
+
+    def test_guest_batch_updates_session_cart(self):
+        first, second = self.products[:2]
+        response = self.post([
+            {'op': 'add', 'product_id': first.id, 'quantity': 2},
+            {'op': 'update', 'product_id': second.id, 'quantity': 3},
+        ])
+        self.assertEqual(response.json()['total'], '10.00')
+        # Same figure as the header badge: units, not lines
+        self.assertEqual(response.json()['cart_count'], 5)
+        self.assertEqual(self.client.session['cart']['items'], {str(first.id): 2, str(second.id): 3})
+        response = self.client.post('/cart/add/', {'product_id': self.products[2].id, 'quantity': 2})
+        self.assertEqual(response.json()['cart_count'], 7)
+
+    def test_invalid_batch_changes_nothing(self):
+        self.client.force_login(self.user)
+        response = self.post([
+            {'op': 'add', 'product_id': self.products[0].id},
+            {'op': 'add', 'product_id': 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', response.json()['message'])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.post([{'op': 'clear', 'product_id': 1}]).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+
+
+class LazyCartSummaryTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.product = make_product(self.category, 1)
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.request.session = SessionStore()
+
+    def test_summary_queries_only_when_read_and_once_per_request(self):
+        with self.assertNumQueries(0):
+            context = cart_context(self.request)
+        with self.assertNumQueries(1):
+            self.assertEqual(context['cart_count'], 0)
+            self.assertEqual(context['cart_total'], Decimal('0.00'))
+            self.assertEqual(cart_context(self.request)['cart_count'], 0)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_summary_reads_stored_totals(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=3)
+        context = cart_context(self.request)
+        self.assertEqual((context['cart_count'], context['cart_total']), (3, Decimal('30.00')))
+
+    def test_browsing_does_not_create_a_cart(self):
+        self.client.force_login(self.user)
+        for url in ('/', '/cart/', '/checkout/'):
+            self.client.get(url)
+        self.assertEqual(self.client.post('/cart/clear/').json()['status'], 'success')
+        self.assertFalse(Cart.objects.exists())
+        self.client.post('/cart/add/', {'product_id': self.product.id})
+        self.assertEqual(Cart.objects.get(user=self.user).item_count, 1)
+
+
+class OrderPlacementTests(TestCase):
+    details = {
+        'first_name': 'Abebe',
+        'last_name': 'Kebede',
+        'email': 'buyer@example.com',
+        'phone': '0911000000',
+        'address': 'Bole',
+        'postal_code': '1000',
+        'city': 'Addis Ababa',
+        'country': 'ET',
+        'payment_method': 'cash',
+    }
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.products = [make_product(self.category, i) for i in range(5)]
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        self.cart = Cart.objects.create(user=self.user)
+        for product in self.products:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def test_place_order_creates_items_and_reserves_stock(self):
+        order = OrderPlacementService().place_order(self.cart, **self.details)
+        self.assertEqual(order.items.count(), 5)
+        self.assertEqual(order.subtotal, Decimal('100.00'))
+        self.assertEqual(order.total, Decimal('110.00'))
+        self.assertEqual(
+            set(Product.objects.values_list('stock', flat=True)), {8}
+        )
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, 0)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_oversell_rolls_back(self):
+        Product.objects.filter(pk=self.products[-1].pk).update(stock=1)
+        with self.assertRaises(InsufficientStockError):
+            OrderPlacementService().place_order(self.cart, **self.details)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.filter(stock=10).count(), 4)
+        self.assertEqual(self.cart.items.count(), 5)
+
+
+    def test_place_order_stores_item_summary(self):
+        order = OrderPlacementService().place_order(self.cart, **self.details)
+        self.assertEqual(order.item_count, 10)
+        with self.assertNumQueries(0):
+            description = order.get_items_description()
+        self.assertEqual(description, ', '.join(f'{product.name} x 2' for product in self.products))
+
+    def test_order_list_is_paginated_with_bounded_queries(self):
+        self.client.force_login(self.user)
+        for _ in range(25):
+            order = Order.objects.create(user=self.user, **self.details)
+            OrderItem.objects.create(order=order, product=self.products[0], price=Decimal('10.00'), quantity=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/orders/')
+        self.assertEqual(len(response.context['orders']), 20)
+        self.assertLess(len(queries), 10)
+        self.assertContains(response, f'{self.products[0].name} x 1')
+
+        response = self.client.get('/orders/', {'cursor': response.context['orders'].next_cursor})
+        self.assertEqual(len(response.context['orders']), 5)
+        self.assertFalse(response.context['orders'].has_next())
+
+    def test_order_list_only_fetches_items_of_orders_without_summary(self):
+        self.client.force_login(self.user)
+        OrderPlacementService().place_order(self.cart, **self.details)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/orders/')
+        self.assertFalse(any('"mainapp_orderitem"' in q['sql'] for q in queries))
+
+        legacy = Order.objects.create(user=self.user, **self.details)
+        OrderItem.objects.create(order=legacy, product=self.products[0], price=Decimal('10.00'), quantity=4)
+        Order.objects.filter(pk=legacy.pk).update(items_summary='')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/orders/')
+        item_queries = [q['sql'] for q in queries if 'FROM "mainapp_orderitem"' in q['sql']]
+        self.assertEqual(len(item_queries), 1)
+        self.assertContains(response, f'{self.products[0].name} x 4')
+
+    def test_reconcile_fills_missing_summaries(self):
+        order = Order.objects.create(user=self.user, **self.details)
+        OrderItem.objects.create(order=order, product=self.products[0], price=Decimal('10.00'), quantity=3)
+        call_command('reconcile_order_summaries', '--missing-only', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual((order.item_count, order.items_summary), (3, f'{self.products[0].name} x 3'))
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Coffee', slug='coffee')
+        self.other = Category.objects.create(name='Spices', slug='spices')
+        self.yirgacheffe = Product.objects.create(
+            category=self.category, name='Yirgacheffe beans', slug='yirgacheffe',
+            description='Floral washed coffee', price=Decimal('12.00'), image='products/test.png'
+        )
+        self.berbere = Product.objects.create(
+            category=self.other, name='Berbere', slug='berbere',
+            description='Spice blend that pairs with coffee ceremonies', price=Decimal('5.00'),
+            image='products/test.png'
+        )
+        self.backend = get_search_backend()
+
+    def search(self, query):
+        return list(self.backend.search(Product.objects.all(), query).order_by('-search_rank'))
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('coffee'), [self.yirgacheffe, self.berbere])
+        self.assertEqual(self.search('yirga'), [self.yirgacheffe])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.berbere.name = 'Mitmita'
+        self.berbere.save()
+        self.assertEqual(self.search('mitmita'), [self.berbere])
+        self.assertEqual(self.search('berbere'), [])
+
+        self.other.name = 'Chili'
+        self.other.save()
+        self.assertEqual(self.search('chili'), [self.berbere])
+
+        self.berbere.delete()
+        self.assertEqual(self.search('mitmita'), [])
+
+    def test_rebuild_command(self):
+        self.backend.clear()
+        self.assertEqual(self.search('coffee'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search('coffee')), 2)
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('"coffee" -('), [self.yirgacheffe, self.berbere])
+        self.assertEqual(self.search('*'), [])
+
+
+class ProductRatingAggregateTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.product = make_product(self.category, 1)
+        self.users = [
+            CustomUser.objects.create_user(email=f'user{i}@example.com', password='pass')
+            for i in range(3)
+        ]
+
+    def review(self, user, rating):
+        return ProductReview.objects.create(
+            product=self.product, user=user, rating=rating, title='Review', content='Text'
+        )
+
+    def assertRatings(self, avg, count, histogram):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_avg, Decimal(avg))
+        self.assertEqual(self.product.rating_count, count)
+        self.assertEqual(self.product.get_rating_histogram(), histogram)
+
+    def test_aggregates_follow_review_changes(self):
+        self.review(self.users[0], 5)
+        second = self.review(self.users[1], 4)
+        self.review(self.users[2], 2)
+        self.assertRatings('3.67', 3, {1: 0, 2: 1, 3: 0, 4: 1, 5: 1})
+
+        second = ProductReview.objects.get(pk=second.pk)
+        second.rating = 1
+        second.save()
+        self.assertRatings('2.67', 3, {1: 1, 2: 1, 3: 0, 4: 0, 5: 1})
+
+        second.delete()
+        self.assertRatings('3.50', 2, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+    def test_saving_unloaded_instance_replaces_rating(self):
+        review = self.review(self.users[0], 5)
+        ProductReview(pk=review.pk, product=self.product, user=self.users[0], rating=2,
+                      title='Review', content='Text', created_at=review.created_at).save()
+        self.assertRatings('2.00', 1, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0})
+
+    def test_product_save_keeps_aggregates(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.review(self.users[0], 4)
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertRatings('4.00', 1, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+
+    def test_reconcile_command(self):
+        self.review(self.users[0], 3)
+        self.review(self.users[1], 5)
+        Product.objects.update(rating_avg=0, rating_count=0, rating_3=0, rating_5=7)
+        call_command('reconcile_product_ratings', stdout=StringIO())
+        self.assertRatings('4.00', 2, {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+
+    def test_listing_sorts_without_review_join(self):
+        self.review(self.users[0], 5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/?sort=rating')
+        self.assertEqual(response.status_code, 200)
+        product_queries = [q['sql'] for q in queries if 'FROM "mainapp_product"' in q['sql']]
+        self.assertTrue(product_queries)
+        self.assertFalse(any('mainapp_productreview' in sql for sql in product_queries))
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class CatalogFragmentCacheTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.category = Category.objects.create(name='Coffee', slug='coffee')
+        self.product = make_product(self.category, 1)
+
+    def product_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [
+            q['sql'] for q in queries
+            if 'FROM "mainapp_product"' in q['sql'] or 'FROM "mainapp_category"' in q['sql']
+        ]
+
+    def test_home_fragments_are_served_from_cache(self):
+        _, first = self.product_queries('/')
+        self.assertTrue(first)
+        _, second = self.product_queries('/')
+        self.assertEqual(second, [])
+
+    def test_model_changes_invalidate_fragments(self):
+        self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed product'
+            self.product.save()
+        response, queries = self.product_queries('/')
+        self.assertTrue(queries)
+        self.assertContains(response, 'Renamed product')
+
+    def test_cart_badge_is_not_cached(self):
+        session = self.client.session
+        session['cart'] = {str(self.product.id): {'quantity': 3, 'price': '10.00'}}
+        session.save()
+        self.assertContains(self.client.get('/'), 'style="display: block"')
+        self.client.cookies.clear()
+        response = self.client.get('/')
+        self.assertEqual(response.context['cart_count'], 0)
+        self.assertNotContains(response, 'style="display: block"')
+
+    def test_sidebar_fragment_key_ignores_order_and_unknown_categories(self):
+        other = Category.objects.create(name='Tea', slug='tea')
+        self.product_queries(f'/products/?category={self.category.id}&category={other.id}')
+        for query in (f'category={other.id}&category={self.category.id}',
+                      f'category={other.id}&category=999&category=x&category={self.category.id}'):
+            response, queries = self.product_queries(f'/products/?{query}')
+            self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+            self.assertEqual(response.content.decode().count('checked>'), 4)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        # Duplicate prices make the id tiebreaker matter
+        for i in range(25):
+            make_product(self.category, i, price=str(10 + i % 3))
+
+    def walk(self, ordering, per_page=4):
+        paginator = KeysetPaginator(Product.objects.all(), ordering, per_page)
+        page = paginator.get_page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(page)
+        return paginator, pages
+
+    def test_walks_every_product_once_in_order(self):
+        for ordering in (['price'], ['-price'], ['name'], ['-created_at'], ['-rating_avg', '-rating_count']):
+            _, pages = self.walk(ordering)
+            seen = [product.pk for page in pages for product in page]
+            expected = list(
+                Product.objects.order_by(*ordering, '-pk' if ordering[-1].startswith('-') else 'pk')
+                .values_list('pk', flat=True)
+            )
+            self.assertEqual(seen, expected, ordering)
+
+    def test_previous_cursor_returns_preceding_page(self):
+        paginator, pages = self.walk(['-price'])
+        for before, after in zip(pages, pages[1:]):
+            previous = paginator.get_page(after.previous_cursor)
+            self.assertEqual(list(previous), list(before))
+        self.assertFalse(pages[0].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_tied_fractional_averages_are_all_reached(self):
+        users = [CustomUser.objects.create_user(email=f'r{i}@example.com', password='pass') for i in range(3)]
+        Product.objects.all().delete()
+        for i in range(6):
+            product = make_product(self.category, 100 + i)
+            for user, rating in zip(users, (5, 4, 4)):
+                ProductReview.objects.create(product=product, user=user, rating=rating, title='-', content='-')
+        _, pages = self.walk(['-rating_avg', '-rating_count'], per_page=2)
+        self.assertEqual(sum(len(page) for page in pages), 6)
+
+    def test_pages_do_not_count(self):
+        paginator = KeysetPaginator(Product.objects.all(), ['price'], 4)
+        page = paginator.get_page()
+        with self.assertNumQueries(1):
+            paginator.get_page(page.next_cursor)
+        self.assertIsNone(paginator.count)
+        self.assertEqual(KeysetPaginator(Product.objects.all(), ['price'], 4, count_mode='approximate').count, 25)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), ['price'], 4)
+        self.assertEqual(list(paginator.get_page('garbage')), list(paginator.get_page()))
+
+    def test_listing_uses_cursor_links(self):
+        response = self.client.get('/products/?sort=price_low')
+        page = response.context['products']
+        self.assertIsInstance(page, KeysetPage)
+        response = self.client.get(f'/products/?sort=price_low&cursor={page.next_cursor}')
+        self.assertEqual(len(response.context['products']), 12)
+        self.assertTrue(response.context['products'].has_previous())
+
+        response = self.client.get('/products/?sort=price_low&page=2')
+        self.assertEqual(response.context['products'].number, 2)
+
+    @override_settings(PRODUCT_LIST_APPROXIMATE_COUNT=True)
+    def test_approximate_count_shows_cap_boundary(self):
+        def add_products(start, stop):
+            Product.objects.bulk_create([
+                Product(category=self.category, name=f'Product {i}', slug=f'product-{i}', description='-',
+                        price=Decimal('10.00'), stock=1)
+                for i in range(start, stop)
+            ])
+
+        add_products(25, KeysetPaginator.count_cap)
+        response = self.client.get('/products/?sort=price_low')
+        self.assertFalse(response.context['products'].paginator.count_is_capped)
+        self.assertContains(response, f'About {KeysetPaginator.count_cap} products')
+
+        add_products(KeysetPaginator.count_cap, KeysetPaginator.count_cap + 1)
+        response = self.client.get('/products/?sort=price_low')
+        self.assertContains(response, f'{KeysetPaginator.count_cap}+ products')
+        self.assertNotContains(response, f'About {KeysetPaginator.count_cap + 1}')
+
+
+class AdminDashboardTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.staff = CustomUser.objects.create_user(email='staff@example.com', password='pass', is_staff=True)
+        # The context processor would otherwise create the cart on the first request
+        Cart.objects.create(user=self.staff)
+        self.client.force_login(self.staff)
+
+    def add_order(self, product, quantity, days_ago=0, paid=True):
+        order = Order.objects.create(
+            user=self.staff, first_name='A', last_name='B', email='staff@example.com',
+            phone='0911000000', address='Bole', postal_code='1000', city='Addis Ababa',
+            country='ET', payment_method='cash'
+        )
+        order.items.create(product=product, price=product.price, quantity=quantity)
+        order.created_at = timezone.now() - timedelta(days=days_ago)
+        order.paid = paid
+        order.save()
+        return order
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin-dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_revenue_counts_quantity(self):
+        product = make_product(self.category, 1, price='10.00')
+        self.add_order(product, 3)
+        self.add_order(product, 1, days_ago=10)
+        self.add_order(product, 5, paid=False)
+        self.add_order(product, 2, days_ago=40)
+
+        response, _ = self.dashboard_queries()
+        self.assertEqual(response.context['sales_today'], Decimal('30.00'))
+        self.assertEqual(response.context['sales_week'], Decimal('30.00'))
+        self.assertEqual(response.context['sales_month'], Decimal('40.00'))
+        top = response.context['top_products'][0]
+        self.assertEqual(top.sold_count, 2)
+        self.assertEqual(top.revenue, Decimal('40.00'))
+        self.assertEqual(top.revenue_growth, 100)
+
+    def test_query_count_does_not_grow_with_products(self):
+        products = [make_product(self.category, i) for i in range(5)]
+        self.add_order(products[0], 1)
+        _, baseline = self.dashboard_queries()
+
+        for product in products[1:]:
+            self.add_order(product, 2)
+            self.add_order(product, 1, days_ago=45)
+        _, queries = self.dashboard_queries()
+        self.assertEqual(queries, baseline)
+
+
+class DailySalesRollupTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test', slug='test')
+        self.products = [make_product(self.category, i) for i in range(2)]
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+
+    def place(self, discount='0.00', paid=True):
+        order = Order.objects.create(
+            user=self.user, first_name='A', last_name='B', email='buyer@example.com',
+            phone='0911000000', address='Bole', postal_code='1000', city='Addis Ababa',
+            country='ET', payment_method='cash', subtotal=Decimal('40.00'), discount=Decimal(discount)
+        )
+        order.items.create(product=self.products[0], price=Decimal('10.00'), quantity=3)
+        order.items.create(product=self.products[1], price=Decimal('10.00'), quantity=1)
+        if paid:
+            order.paid = True
+            order.save()
+        return order
+
+    def rollup(self, product):
+        return DailySalesRollup.objects.get(product=product, date=timezone.localdate())
+
+    def test_paid_flip_updates_rollup(self):
+        order = self.place(paid=False)
+        self.assertFalse(DailySalesRollup.objects.exists())
+
+        order.paid = True
+        order.save()
+        order.save()
+        self.place(discount='4.00')
+
+        row = self.rollup(self.products[0])
+        self.assertEqual(row.units, 6)
+        self.assertEqual(row.gross, Decimal('60.00'))
+        self.assertEqual(row.discount, Decimal('3.00'))
+        self.assertEqual(row.order_count, 2)
+        self.assertEqual(row.category, self.category)
+        self.assertEqual(self.rollup(self.products[1]).discount, Decimal('1.00'))
+
+        order = Order.objects.get(pk=order.pk)
+        order.paid = False
+        order.save()
+        self.assertEqual(self.rollup(self.products[0]).units, 3)
+
+    def test_lines_of_paid_orders_are_rolled_up(self):
+        order = Order.objects.create(
+            user=self.user, first_name='A', last_name='B', email='buyer@example.com',
+            phone='0911000000', address='Bole', postal_code='1000', city='Addis Ababa',
+            country='ET', payment_method='cash', subtotal=Decimal('40.00'), paid=True
+        )
+        self.assertFalse(DailySalesRollup.objects.exists())
+        item = order.items.create(product=self.products[0], price=Decimal('10.00'), quantity=3)
+        self.assertEqual((self.rollup(self.products[0]).units, self.rollup(self.products[0]).order_count), (3, 1))
+
+        item.quantity = 4
+        item.save()
+        row = self.rollup(self.products[0])
+        self.assertEqual((row.units, row.gross, row.order_count), (4, Decimal('40.00'), 1))
+
+        item.delete()
+        row = self.rollup(self.products[0])
+        self.assertEqual((row.units, row.gross, row.order_count), (0, Decimal('0.00'), 0))
+
+    def test_backfill_matches_incremental_rollup(self):
+        self.place(discount='4.00')
+        self.place()
+        self.place(paid=False)
+        expected = list(DailySalesRollup.objects.order_by('product').values_list(
+            'product', 'units', 'gross', 'discount', 'order_count'
+        ))
+
+        DailySalesRollup.objects.all().delete()
+        call_command('backfill_sales_rollup', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(DailySalesRollup.objects.order_by('product').values_list(
+            'product', 'units', 'gross', 'discount', 'order_count'
+        )), expected)
+
+
+class ConversationInboxTests(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(email='seller@example.com', password='pass')
+        Cart.objects.create(user=self.seller)
+        self.client.force_login(self.seller)
+
+    def add_conversation(self, index):
+        buyer = CustomUser.objects.create_user(email=f'buyer{index}@example.com', password='pass')
+        listing = UserProduct.objects.create(
+            seller=self.seller, name=f'Listing {index}', description='-', price=Decimal('5.00'),
+            image='user_products/test.png', slug=f'listing-{index}'
+        )
+        conversation = Conversation.objects.create(product=listing, buyer=buyer, seller=self.seller)
+        Message.objects.create(conversation=conversation, sender=buyer, content='Is it available?')
+        Message.objects.create(conversation=conversation, sender=buyer, content='Still there?')
+        return conversation
+
+    def inbox_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/conversations/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_counters_follow_send_and_read(self):
+        conversation = self.add_conversation(1)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.seller_unread, 2)
+        self.assertEqual(conversation.last_message.content, 'Still there?')
+        self.assertEqual(conversation.last_message.recipient, self.seller)
+        self.assertEqual(Conversation.objects.unread_total(self.seller), 2)
+
+        self.assertEqual(conversation.mark_read(self.seller), 2)
+        Message.objects.create(conversation=conversation, sender=self.seller, content='Yes')
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.seller_unread, conversation.buyer_unread), (0, 1))
+        self.assertEqual(Conversation.objects.unread_total(conversation.buyer), 1)
+
+    def test_mark_read_does_not_take_drifted_counter_below_zero(self):
+        conversation = self.add_conversation(1)
+        Conversation.objects.filter(pk=conversation.pk).update(seller_unread=1)
+        self.assertEqual(conversation.mark_read(self.seller), 2)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.seller_unread, 0)
+
+    def test_reconcile_command(self):
+        conversation = self.add_conversation(1)
+        Message.objects.update(recipient=None)
+        Conversation.objects.update(seller_unread=0, last_message=None, last_message_at=None)
+        call_command('reconcile_conversations', stdout=StringIO())
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.seller_unread, 2)
+        self.assertEqual(conversation.last_message.content, 'Still there?')
+        self.assertFalse(Message.objects.exclude(recipient=self.seller).exists())
+
+    def test_inbox_query_count_does_not_grow_with_threads(self):
+        self.add_conversation(1)
+        response, baseline = self.inbox_queries()
+        self.assertEqual(response.context['conversations'][0].unread_count, 2)
+
+        for index in range(2, 6):
+            self.add_conversation(index)
+        response, queries = self.inbox_queries()
+        self.assertEqual(len(response.context['conversations']), 5)
+        self.assertEqual(queries, baseline)
+
+
+class MessageNotificationTests(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(email='seller@example.com', password='pass')
+        self.buyer = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        listing = UserProduct.objects.create(
+            seller=self.seller, name='Listing', description='-', price=Decimal('5.00'),
+            image='user_products/test.png', slug='listing'
+        )
+        self.conversation = Conversation.objects.create(product=listing, buyer=self.buyer, seller=self.seller)
+
+    def test_in_process_broker_delivers_across_threads(self):
+        broker = InProcessBroker()
+
+        async def receive():
+            async with broker.subscribe('user.1') as subscription:
+                await sync_to_async(broker.publish, thread_sensitive=False)('user.1', {'type': 'unread', 'count': 3})
+                return await asyncio.wait_for(subscription.get(), 1)
+
+        self.assertEqual(async_to_sync(receive)(), {'type': 'unread', 'count': 3})
+        self.assertFalse(broker._subscribers)
+
+    def test_wsgi_pages_poll_instead_of_streaming(self):
+        self.client.force_login(self.seller)
+        response = self.client.get('/')
+        self.assertContains(response, 'data-unread-count-url="/api/unread-messages/"')
+        self.assertNotContains(response, 'data-message-stream-url')
+        request = RequestFactory().get('/api/messages/stream/')
+        self.assertEqual(async_to_sync(message_stream)(request).status_code, 404)
+
+    def test_stream_pushes_new_messages_without_polling(self):
+        request = AsyncRequestFactory().get('/api/messages/stream/')
+        request.auser = sync_to_async(lambda: self.seller)
+
+        async def read_stream(queries):
+            query_count = sync_to_async(lambda: len(queries))
+            response = await message_stream(request)
+            stream = aiter(response.streaming_content)
+            first = await anext(stream)
+            before_idle = await query_count()
+            pending = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0.05)
+            idle_queries = await query_count() - before_idle
+            await sync_to_async(self.send)()
+            events = [await asyncio.wait_for(pending, 1), await asyncio.wait_for(anext(stream), 1)]
+            await stream.aclose()
+            return first, idle_queries, events
+
+        with CaptureQueriesContext(connection) as queries:
+            first, idle_queries, events = async_to_sync(read_stream)(queries)
+        self.assertIn(b'"count": 0', first)
+        self.assertEqual(idle_queries, 0)
+        self.assertTrue(events[0].startswith(b'event: message'))
+        self.assertIn(b'"content": "Hello"', events[0])
+        self.assertTrue(events[1].startswith(b'event: unread'))
+        self.assertIn(b'"count": 1', events[1])
+
+    def send(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(conversation=self.conversation, sender=self.buyer, content='Hello')
+
+
+class ConversationMessagePaginationTests(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(email='seller@example.com', password='pass')
+        self.buyer = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        Cart.objects.create(user=self.seller)
+        listing = UserProduct.objects.create(
+            seller=self.seller, name='Listing', description='-', price=Decimal('5.00'),
+            image='user_products/test.png', slug='listing'
+        )
+        self.conversation = Conversation.objects.create(product=listing, buyer=self.buyer, seller=self.seller)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.buyer, content=f'Message {i}')
+            for i in range(MESSAGES_PER_PAGE + 5)
+        ]
+        self.client.force_login(self.seller)
+
+    def test_detail_shows_latest_page_and_older_pages_chain(self):
+        response = self.client.get(f'/conversations/{self.conversation.pk}/')
+        shown = response.context['messages']
+        self.assertEqual([m.pk for m in shown], [m.pk for m in self.messages[5:]])
+
+        older = self.client.get(
+            f'/conversations/{self.conversation.pk}/messages/older/',
+            {'cursor': response.context['older_cursor']}
+        ).json()
+        self.assertEqual([m['id'] for m in older['messages']], [m.pk for m in self.messages[:5]])
+        self.assertIsNone(older['older_cursor'])
+
+    def test_read_thread_does_not_update_again(self):
+        self.client.get(f'/conversations/{self.conversation.pk}/')
+        self.assertEqual(Message.objects.filter(is_read=False).count(), 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/conversations/{self.conversation.pk}/')
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in queries))
+
+    def test_since_returns_only_newer_messages(self):
+        after = self.messages[-3].pk
+        data = self.client.get(
+            f'/conversations/{self.conversation.pk}/messages/since/', {'after': after}
+        ).json()
+        self.assertEqual([m['id'] for m in data['messages']], [m.pk for m in self.messages[-2:]])
+        self.assertFalse(data['has_more'])
+
+    def test_other_users_cannot_read_thread(self):
+        self.client.force_login(CustomUser.objects.create_user(email='other@example.com', password='pass'))
+        response = self.client.get(f'/conversations/{self.conversation.pk}/messages/since/')
+        self.assertEqual(response.status_code, 404)
+
+
+class TelebirrClientTests(TestCase):
+    def start_gateway(self, **options):
+        server = make_server(**options)
+        ports = []
+        handle = server.RequestHandlerClass.handle_one_request
+
+        def record(handler):
+            ports.append(handler.client_address[1])
+            return handle(handler)
+
+        server.RequestHandlerClass.handle_one_request = record
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+        return f'http://{host}:{port}/payment', ports
+
+    def test_requests_reuse_pooled_connection(self):
+        url, ports = self.start_gateway()
+        client = TelebirrClient(url)
+        for _ in range(3):
+            self.assertEqual(client.post('verify', {'outTradeNo': '1'}, idempotent=True).status_code, 200)
+        self.assertEqual(len(set(p for p in ports if p)), 1)
+
+    def test_circuit_opens_and_fails_fast(self):
+        url, ports = self.start_gateway(failure_rate=1.0)
+        client = TelebirrClient(url, max_retries=1, backoff=0, breaker=CircuitBreaker(failure_threshold=2))
+        self.assertEqual(client.post('verify', {}, idempotent=True).status_code, 503)
+        calls = len(ports)
+        with self.assertRaises(CircuitOpenError):
+            client.post('verify', {}, idempotent=True)
+        self.assertEqual(len(ports), calls)
+
+    def test_server_errors_and_timeouts_count_as_failures(self):
+        client = TelebirrClient('http://gateway.invalid/payment', max_retries=0,
+                                breaker=CircuitBreaker(failure_threshold=3))
+        client.session.post = mock.Mock(side_effect=[
+            mock.Mock(status_code=500), mock.Mock(status_code=501), requests.ReadTimeout('read timed out'),
+        ])
+        self.assertEqual(client.post('verify', {}).status_code, 500)
+        self.assertEqual(client.post('verify', {}).status_code, 501)
+        with self.assertRaises(GatewayUnavailable):
+            client.post('verify', {})
+        with self.assertRaises(CircuitOpenError):
+            client.post('verify', {})
+        self.assertEqual(client.session.post.call_count, 3)
+
+    def test_half_open_trial_closes_circuit(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        now[0] = 31.0
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        breaker.before_call()
+
+    def test_unreachable_gateway_is_bounded(self):
+        client = TelebirrClient('http://127.0.0.1:9/payment', timeout=(0.2, 0.2), max_retries=1, backoff=0)
+        with self.assertRaises(GatewayUnavailable):
+            client.post('', {})
+
+    def test_service_creates_payment_through_client(self):
+        url, _ = self.start_gateway()
+        user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        order = Order.objects.create(
+            user=user, first_name='A', last_name='B', email='buyer@example.com', phone='0911000000',
+            address='Bole', postal_code='1000', city='Addis Ababa', country='ET', payment_method='telebirr'
+        )
+        service = TelebirrPaymentService(client=TelebirrClient(url))
+        result = service.create_payment(order, Decimal('10.00'), 'Order', 'Payment')
+        self.assertTrue(result['success'])
+        self.assertEqual(service.verify_payment(str(order.pk)), {'success': True, 'status': 'completed'})
+
+    def test_rsa_key_is_parsed_once(self):
+        public_key = RSA.generate(1024).publickey().export_key().decode()
+        self.assertIs(_rsa_cipher(public_key), _rsa_cipher(public_key))
+
+
+class PaymentNotificationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        self.order = Order.objects.create(
+            user=self.user, first_name='A', last_name='B', email='buyer@example.com', phone='0911000000',
+            address='Bole', postal_code='1000', city='Addis Ababa', country='ET', payment_method='telebirr'
+        )
+        TelebirrPayment.objects.create(order=self.order, amount=Decimal('10.00'), transaction_id=str(self.order.pk))
+
+    def notify(self):
+        return self.client.post(
+            '/payment/notify/', json.dumps({'outTradeNo': str(self.order.pk)}), content_type='application/json'
+        )
+
+    def processor(self, verify_result):
+        service = TelebirrPaymentService(client=object())
+        service.verify_payment = lambda transaction_id, payment=None: dict(verify_result)
+        return PaymentNotificationProcessor(service=service, max_attempts=2)
+
+    def test_webhook_records_once_without_calling_gateway(self):
+        for _ in range(3):
+            self.assertEqual(self.notify().json(), {'status': 'success'})
+        notification = PaymentNotification.objects.get()
+        self.assertEqual(notification.status, 'pending')
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.paid)
+
+    def test_worker_marks_order_paid_once(self):
+        self.notify()
+        processor = self.processor({'success': True, 'status': 'completed'})
+        self.assertEqual(processor.process_batch(), {'done': 1})
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+        self.assertEqual(self.order.status, 'processing')
+
+        self.notify()
+        self.assertEqual(processor.process_batch(), {})
+        self.assertFalse(processor.mark_order_paid(self.order.pk))
+
+    def test_gateway_outage_is_retried_then_given_up(self):
+        self.notify()
+        processor = self.processor({'success': False, 'error': 'down', 'retry': True})
+        self.assertEqual(processor.process_batch(), {'pending': 1})
+        self.assertEqual(processor.process_batch(), {'failed': 1})
+        notification = PaymentNotification.objects.get()
+        self.assertEqual((notification.attempts, notification.last_error), (2, 'down'))
+
+        # Replaying the same notification does not buy more gateway calls
+        self.notify()
+        self.assertEqual(PaymentNotification.objects.get().status, 'failed')
+
+        # New data does, without resetting the attempt count
+        payload = {'outTradeNo': str(self.order.pk), 'tradeStatus': 'Completed'}
+        self.client.post('/payment/notify/', json.dumps(payload), content_type='application/json')
+        notification = PaymentNotification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ('pending', 2))
+        self.assertEqual(processor.process_batch(), {'failed': 1})
+
+    def test_missing_payment_is_requeued_by_repeat(self):
+        TelebirrPayment.objects.all().delete()
+        self.notify()
+        processor = self.processor({'success': True, 'status': 'completed'})
+        self.assertEqual(processor.process_batch(), {'failed': 1})
+        TelebirrPayment.objects.create(order=self.order, amount=Decimal('10.00'), transaction_id=str(self.order.pk))
+        self.notify()
+        self.assertEqual(processor.process_batch(), {'done': 1})
+
+
+class PaymentReconciliationTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        self.orders = [
+            Order.objects.create(
+                user=user, first_name='A', last_name='B', email='buyer@example.com', phone='0911000000',
+                address='Bole', postal_code='1000', city='Addis Ababa', country='ET', payment_method='telebirr'
+            )
+            for _ in range(5)
+        ]
+        for order in self.orders:
+            TelebirrPayment.objects.create(order=order, amount=Decimal('10.00'), transaction_id=str(order.pk))
+        TelebirrPayment.objects.filter(order__in=self.orders[:4]).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_reconcile_verifies_stale_payments_in_bulk(self):
+        server = make_server()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+        service = TelebirrPaymentService(client=TelebirrClient(f'http://{host}:{port}/payment'))
+
+        out = StringIO()
+        with mock.patch('mainapp.management.commands.reconcile_payments.get_telebirr_service', return_value=service):
+            call_command('reconcile_payments', chunk_size=3, workers=4, stdout=out)
+
+        self.assertIn('Checked 4 payments', out.getvalue())
+        self.assertEqual(TelebirrPayment.objects.filter(status='completed').count(), 4)
+        self.assertEqual(Order.objects.filter(paid=True).count(), 4)
+        self.assertFalse(Order.objects.get(pk=self.orders[4].pk).paid)
+
+    def test_mark_paid_flips_each_order_once(self):
+        orders = Order.objects.filter(pk__in=[order.pk for order in self.orders[:2]])
+        self.assertEqual(len(orders.mark_paid()), 2)
+        self.assertEqual(orders.mark_paid(), [])
+
+
+class PayPalApiTests(TestCase):
+    def start_api(self, **options):
+        server = make_paypal_server(**options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+        api = PayPalApi(mode='sandbox', client_id='id', client_secret='secret', endpoint=f'http://{host}:{port}')
+        return api, server.RequestHandlerClass
+
+    def create_payment(self, api):
+        payment = paypalrestsdk.Payment({
+            'intent': 'sale',
+            'payer': {'payment_method': 'paypal'},
+            'transactions': [{'amount': {'total': '10.00', 'currency': 'USD'}}],
+        }, api=api)
+        self.assertTrue(payment.create(), payment.error)
+        return payment
+
+    def test_token_is_reused_across_payments(self):
+        api, handler = self.start_api()
+        for _ in range(3):
+            payment = self.create_payment(api)
+        self.assertEqual(handler.token_requests, 1)
+        self.assertEqual([link.method for link in payment.links], ['REDIRECT'])
+
+    def test_token_is_refreshed_before_it_expires(self):
+        api, handler = self.start_api(token_lifetime=90)
+        self.create_payment(api)
+        api.token_request_at -= timedelta(seconds=20)
+        self.create_payment(api)
+        self.assertEqual(handler.token_requests, 1)
+        api.token_request_at -= timedelta(seconds=20)
+        self.create_payment(api)
+        self.assertEqual(handler.token_requests, 2)
+
+    def test_checkout_redirects_with_shared_api(self):
+        api, handler = self.start_api()
+        user = CustomUser.objects.create_user(email='buyer@example.com', password='pass')
+        Cart.objects.create(user=user)
+        order = Order.objects.create(
+            user=user, first_name='A', last_name='B', email='buyer@example.com', phone='0911000000',
+            address='Bole', postal_code='1000', city='Addis Ababa', country='ET', payment_method='paypal'
+        )
+        self.client.force_login(user)
+        with self.settings(PAYPAL_CLIENT_ID='id', PAYPAL_SECRET_KEY='secret'), \
+                mock.patch('mainapp.views.get_paypal_api', return_value=api):
+            for _ in range(2):
+                response = self.client.get(f'/payment/paypal/{order.pk}/')
+                self.assertIn('/checkout/PAY-', response['Location'])
+        self.assertEqual(handler.token_requests, 1)
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0, IMAGE_VARIANT_WIDTHS=(160, 320, 640))
+class ResponsiveImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        get_catalog_cache().clear()
+        self.category = Category.objects.create(name='Coffee', slug='coffee')
+
+    def upload(self, name, size=(480, 360)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'brown').save(buffer, format='PNG')
+        return ContentFile(buffer.getvalue(), name=name)
+
+    def make_product(self, index, image):
+        product = Product(category=self.category, name=f'Product {index}', slug=f'product-{index}',
+                          description='-', price=Decimal('10.00'), stock=1, image=image)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        process_pending()
+        return product
+
+    def test_upload_is_queued_not_generated_in_request(self):
+        product = Product(category=self.category, name='Beans', slug='beans', description='-',
+                          price=Decimal('10.00'), stock=1, image=self.upload('beans.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertFalse(ImageDerivative.objects.exists())
+        self.assertTrue(PendingImage.objects.filter(source=product.image.name).exists())
+
+        out = StringIO()
+        call_command('generate_image_variants', pending=True, stdout=out)
+        self.assertTrue(ImageDerivative.objects.filter(source=product.image.name).exists())
+        self.assertFalse(PendingImage.objects.exists())
+        self.assertIn('Generated variants for 1 images, 0 failed', out.getvalue())
+
+    def test_upload_generates_capped_variants(self):
+        product = self.make_product(1, self.upload('beans.png'))
+        derivative = ImageDerivative.objects.get(source=product.image.name)
+        self.assertEqual(derivative.widths, [160, 320, 480])
+        self.assertEqual((derivative.width, derivative.height), (480, 360))
+        for width in derivative.widths:
+            for fmt in derivative.formats:
+                path = variant_path(derivative.digest, width, fmt)
+                with default_storage.open(path) as f, Image.open(f) as variant:
+                    self.assertEqual(variant.width, width)
+
+    def test_identical_uploads_share_variants(self):
+        first = self.make_product(1, self.upload('beans.png'))
+        second = self.make_product(2, self.upload('beans.png'))
+        self.assertNotEqual(first.image.name, second.image.name)
+        digests = set(ImageDerivative.objects.values_list('digest', flat=True))
+        self.assertEqual(len(digests), 1)
+
+    def test_tag_renders_srcset_and_falls_back_to_original(self):
+        template = Template('{% load images %}{% responsive_image image sizes="50vw" alt="Beans" class="card-img-top" %}')
+        product = self.make_product(1, self.upload('beans.png'))
+        html = template.render(Context({'image': product.image}))
+        self.assertIn('<picture><source type="image/avif"', html)
+        self.assertIn('320w.webp 320w', html)
+        self.assertIn('sizes="50vw"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('class="card-img-top"', html)
+
+        ImageDerivative.objects.all().delete()
+        get_catalog_cache().clear()
+        html = template.render(Context({'image': product.image}))
+        self.assertIn(f'<img src="{product.image.url}"', html)
+        self.assertIsNone(get_variants(product.image.name))
+
+    def test_manifests_are_batched_and_misses_are_not_cached(self):
+        products = [self.make_product(i, self.upload(f'beans{i}.png')) for i in range(3)]
+        names = [product.image.name for product in products]
+        get_catalog_cache().clear()
+        with self.assertNumQueries(1):
+            manifests = get_variants_many(names + ['products/missing.png'])
+        self.assertIsNone(manifests['products/missing.png'])
+        with self.assertNumQueries(0):
+            get_variants_many(names)
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_variants('products/missing.png'))
+
+        template = Template(
+            '{% load images %}{% prefetch_image_variants products %}'
+            '{% for product in products %}{% responsive_image product.image %}{% endfor %}'
+        )
+        get_catalog_cache().clear()
+        with self.assertNumQueries(1):
+            html = template.render(Context({'products': products}))
+        self.assertEqual(html.count('<picture>'), 3)
+
+    def test_cached_fragments_pick_up_new_variants(self):
+        # Saved without running on_commit: the variants are not there yet
+        product = Product.objects.create(category=self.category, name='Beans', slug='beans', description='-',
+                                         price=Decimal('10.00'), stock=1, image=self.upload('beans.png'))
+        self.assertNotContains(self.client.get('/'), '<picture>')
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_variants(product.image.name)
+        self.assertContains(self.client.get('/'), '<picture>')
+
+    @override_settings(CATALOG_CACHE_PENDING_TIMEOUT=0)
+    def test_fragments_with_pending_images_expire_without_version_bump(self):
+        product = Product.objects.create(category=self.category, name='Beans', slug='beans', description='-',
+                                         price=Decimal('10.00'), stock=1, image=self.upload('beans.png'))
+        self.assertNotContains(self.client.get('/'), '<picture>')
+        # Generated in another process with a per-process catalog cache: the
+        # version bump (an on_commit callback here) never reaches this process
+        generate_variants(product.image.name)
+        self.assertContains(self.client.get('/'), '<picture>')
+
+    def test_backfill_command_covers_existing_media(self):
+        name = default_storage.save('user_products/listing.png', self.upload('listing.png'))
+        seller = CustomUser.objects.create_user(email='seller@example.com', password='pass')
+        UserProduct.objects.create(seller=seller, name='Listing', description='-', price=Decimal('5.00'),
+                                   image=name, slug='listing')
+        self.assertFalse(ImageDerivative.objects.exists())
+        out = StringIO()
+        call_command('generate_image_variants', workers=0, stdout=out)
+        self.assertTrue(ImageDerivative.objects.filter(source=name).exists())
+        self.assertIn('Generated variants for 1 images', out.getvalue())
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.static_root = tempfile.mkdtemp()
+        for directory in (self.source_dir, self.static_root):
+            self.addCleanup(shutil.rmtree, directory)
+        clear_asset_urls()
+        self.addCleanup(clear_asset_urls)
+
+    def test_vendoring_downloads_fonts_referenced_by_stylesheets(self):
+        responses = {url: b'/* vendored */' for url in VENDOR_ASSETS.values()}
+        fa_url = VENDOR_ASSETS['vendor/fontawesome/css/all.min.css']
+        responses[fa_url] = b'@font-face{src:url(../webfonts/fa-solid-900.woff2) format("woff2"),url(data:font/woff2;base64,AA==)}'
+        responses['https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/webfonts/fa-solid-900.woff2'] = b'font'
+        session = mock.Mock()
+        session.get.side_effect = lambda url, **kwargs: mock.Mock(content=responses[url])
+
+        written = vendor_assets(self.source_dir, session=session)
+        self.assertEqual(sorted(written), sorted(VENDOR_ASSETS))
+        css_dir = os.path.join(self.source_dir, 'vendor', 'fontawesome', 'css')
+        with open(os.path.join(css_dir, 'all.min.css')) as f:
+            css = f.read()
+        self.assertIn('url(fonts/fa-solid-900.woff2)', css)
+        self.assertIn('url(data:font/woff2;base64,AA==)', css)
+        self.assertTrue(os.path.exists(os.path.join(css_dir, 'fonts', 'fa-solid-900.woff2')))
+        self.assertEqual(vendor_assets(self.source_dir, session=session), [])
+
+    def test_vendored_assets_fall_back_to_cdn_only_when_allowed(self):
+        path = 'vendor/jquery/jquery.min.js'
+        with self.settings(STATICFILES_DIRS=[self.source_dir], STATIC_ROOT=self.static_root):
+            with self.settings(VENDOR_ASSET_CDN_FALLBACK=True):
+                self.assertEqual(asset_url(path), VENDOR_ASSETS[path])
+            with self.settings(VENDOR_ASSET_CDN_FALLBACK=False):
+                with self.assertRaises(ImproperlyConfigured):
+                    asset_url(path)
+                self.assertIn(path, ' '.join(error.msg for error in check_vendored_assets(None)))
+                with self.assertRaises(CommandError):
+                    call_command('build_assets', '--check', stdout=StringIO())
+
+                os.makedirs(os.path.join(self.source_dir, 'vendor', 'jquery'))
+                open(os.path.join(self.source_dir, *path.split('/')), 'w').close()
+                # Picked up without restarting: the fallback was never memoized
+                self.assertEqual(asset_url(path), f'/static/{path}')
+
+    def test_collected_assets_are_fingerprinted_compressed_and_cached(self):
+        with open(os.path.join(self.source_dir, 'site.css'), 'w') as f:
+            f.write('body { color: #111; }\n' * 100)
+        with self.settings(
+            STATICFILES_DIRS=[self.source_dir],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_ROOT=self.static_root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'mainapp.storage.CompressedManifestStaticFilesStorage'},
+            },
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = asset_url('site.css')
+            self.assertRegex(url, r'^/static/site\.[0-9a-f]{12}\.css$')
+
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertIn(b'color: #111', gzip.decompress(b''.join(response.streaming_content)))
+
+            response = self.client.get('/static/site.css')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+            self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
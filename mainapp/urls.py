@@ -15,6 +15,7 @@ urlpatterns = [
     path('cart/remove/', views.cart_remove, name='cart_remove'),
     path('cart/update-session/', views.cart_update, name='cart_update_session'),
     path('cart/remove-session/', views.cart_remove, name='cart_remove_session'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('cart/clear/', views.cart_clear, name='cart_clear'),
     path('cart/apply-coupon/', views.apply_coupon, name='apply_coupon'),
     path('checkout/', views.checkout, name='checkout'),
@@ -41,8 +42,11 @@ urlpatterns = [
     path('user/products/<slug:slug>/delete/', views.delete_product, name='delete_product'),
     path('conversations/', views.conversations, name='conversations'),
     path('conversations/<int:conversation_id>/', views.conversation_detail, name='conversation_detail'),
+    path('conversations/<int:conversation_id>/messages/older/', views.conversation_messages_older, name='conversation_messages_older'),
+    path('conversations/<int:conversation_id>/messages/since/', views.conversation_messages_since, name='conversation_messages_since'),
     path('product/<int:product_id>/message/', views.start_conversation, name='start_conversation'),
     path('api/unread-messages/', views.get_unread_message_count, name='unread_messages'),
+    path('api/messages/stream/', views.message_stream, name='message_stream'),
     path('dashboard/', views.user_dashboard, name='user_dashboard'),
     path('payment/initiate/<int:order_id>/', views.initiate_payment, name='initiate_payment'),
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
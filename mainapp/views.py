@@ -1,14 +1,16 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q, Avg, Count, Sum, F
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Q, Avg, Count, Sum, F, prefetch_related_objects
 from django.core.paginator import Paginator
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from .models import Product, Category, Cart, CartItem, Order, OrderItem, Coupon, ProductRating, Newsletter, ProductReview, ReviewImage, UserProduct, Conversation, Message, TelebirrPayment, User
+from .models import Product, Category, Cart, CartItem, Order, OrderItem, Coupon, ProductRating, Newsletter, ProductReview, ReviewImage, UserProduct, Conversation, Message, TelebirrPayment, User, DailySalesRollup, PaymentNotification
 from .forms import CheckoutForm, ProductReviewForm, ReviewImageForm, UserProductForm
 import paypalrestsdk
+import asyncio
 import json
 import requests
 from decimal import Decimal
@@ -21,12 +23,25 @@ from django.core.validators import validate_email
 from django.http import Http404
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
-from .services import TelebirrPaymentService
+from .services import OrderPlacementService, get_telebirr_service
+from .cart import (
+    batch_update_cart, batch_update_session_cart, get_session_cart, get_session_quantities, parse_cart_operations,
+    save_session_cart
+)
+from .search import get_search_backend
+from .pagination import KeysetPaginator
+from .paypal import get_paypal_api
+from .notifications import (
+    format_event, get_broker, message_payload, publish_unread_count, stream_supported, user_channel
+)
 from datetime import timedelta
+from functools import partial
+from asgiref.sync import sync_to_async
 
 logger = logging.getLogger(__name__)
 
 def home(request):
+    # Lazy querysets: they are only evaluated when the cached fragments miss
     featured_products = Product.objects.filter(available=True)[:8]
     categories = Category.objects.all()
     return render(request, 'mainapp/home.html', {
@@ -34,29 +49,73 @@ def home(request):
         'categories': categories
     })
 
+def sidebar_categories():
+    """Categories with their available product count, rendered in the cached sidebar."""
+    return Category.objects.annotate(
+        product_count=Count('products', filter=Q(products__available=True))
+    )
+
+PRODUCTS_PER_PAGE = 12
+ORDERS_PER_PAGE = 20
+
+# Keyset orderings per listing sort; the paginator appends the id tiebreaker
+KEYSET_ORDERINGS = {
+    'price_low': ['price'],
+    'price_high': ['-price'],
+    'newest': ['-created_at'],
+    'rating': ['-rating_avg', '-rating_count'],
+}
+
+def paginate_products(request, products, sort_by):
+    """
+    Paginate a product listing with ``?cursor=`` keyset pagination.
+
+    ``?page=N`` links and relevance-sorted search results keep using the
+    page-number Paginator.
+    """
+    if 'page' in request.GET or sort_by == 'relevance':
+        return Paginator(products, PRODUCTS_PER_PAGE).get_page(request.GET.get('page'))
+    paginator = KeysetPaginator(
+        products,
+        KEYSET_ORDERINGS.get(sort_by, ['name']),
+        PRODUCTS_PER_PAGE,
+        count_mode='approximate' if settings.PRODUCT_LIST_APPROXIMATE_COUNT else None
+    )
+    return paginator.get_page(request.GET.get('cursor'))
+
+def pagination_query(request):
+    """Current listing filters, for building pagination links."""
+    query = request.GET.copy()
+    query.pop('page', None)
+    query.pop('cursor', None)
+    return query.urlencode()
+
 def product_list(request, category_slug=None):
     # Get category_slug from URL parameter or GET parameter
     category_slug = category_slug or request.GET.get('category')
     search_query = request.GET.get('q')
-    sort_by = request.GET.get('sort', 'name')
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'name')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     
     products = Product.objects.filter(available=True)
     
-    # Handle multiple category filters
+    # Handle multiple category filters. The sorted ids of existing categories
+    # also key the cached sidebar, so any order, duplicates or unknown ids in
+    # the query string map to the same fragment.
     category_ids = request.GET.getlist('category')
+    selected_categories = []
     if category_ids:
-        products = products.filter(category_id__in=category_ids)
+        selected_categories = sorted(Category.objects.filter(
+            pk__in=[category_id for category_id in category_ids if category_id.isdigit()]
+        ).values_list('pk', flat=True))
+        products = products.filter(category_id__in=selected_categories)
     elif category_slug:
         category = get_object_or_404(Category, slug=category_slug)
         products = products.filter(category=category)
     
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        products = get_search_backend().search(products, search_query)
     
     # Apply price range filters if provided
     if min_price:
@@ -80,28 +139,23 @@ def product_list(request, category_slug=None):
     elif sort_by == 'newest':
         products = products.order_by('-created_at')
     elif sort_by == 'rating':
-        products = products.annotate(avg_rating=Avg('reviews__rating')).order_by('-avg_rating')
+        products = products.order_by('-rating_avg', '-rating_count')
+    elif sort_by == 'relevance' and search_query:
+        products = products.order_by('-search_rank', 'name')
     else:
         products = products.order_by('name')
     
-    # Annotate products with average rating and review count
-    products = products.annotate(
-        avg_rating=Avg('reviews__rating'),
-        review_count=Count('reviews')
-    )
-    
-    paginator = Paginator(products, 12)
-    page = request.GET.get('page')
-    products = paginator.get_page(page)
+    products = paginate_products(request, products, sort_by)
     
     return render(request, 'mainapp/product_list.html', {
         'products': products,
-        'categories': Category.objects.all(),
+        'pagination_query': pagination_query(request),
+        'categories': sidebar_categories(),
         'current_category': category_slug,
         'current_sort': sort_by,
         'min_price': min_price,
         'max_price': max_price,
-        'selected_categories': category_ids
+        'selected_categories': selected_categories
     })
 
 def product_detail(request, slug):
@@ -111,14 +165,11 @@ def product_detail(request, slug):
     related_products = Product.objects.filter(
         category=product.category,
         available=True
-    ).exclude(id=product.id).annotate(
-        avg_rating=Avg('reviews__rating'),
-        review_count=Count('reviews')
-    ).order_by('-avg_rating', '-created_at')[:12]  # Show 12 related products
+    ).exclude(id=product.id).select_related('category').order_by('-rating_avg', '-created_at')[:12]  # Show 12 related products
     
     # Get average rating and review count for the current product
-    avg_rating = product.reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
-    review_count = product.reviews.count()
+    avg_rating = product.rating_avg
+    review_count = product.rating_count
     
     # Get user's existing rating if any
     user_rating = None
@@ -152,54 +203,52 @@ def cart_add(request):
             product = get_object_or_404(Product, id=product_id)
             
             if request.user.is_authenticated:
-                # Check if product already exists in cart
-                cart_item = CartItem.objects.filter(
-                    cart__user=request.user,
-                    product=product
-                ).first()
+                # Insert-if-absent, then recompute and read back the totals;
+                # the unique (cart, product) constraint absorbs double-clicks
+                carts = Cart.objects.filter(user=request.user)
+                with transaction.atomic():
+                    added = carts.add_item(product.id, int(quantity))
+                    totals = carts.totals()
+                    if totals is None:
+                        # get_or_create: a concurrent first add may have just created it
+                        Cart.objects.get_or_create(user=request.user)
+                        added = carts.add_item(product.id, int(quantity))
+                        totals = carts.totals()
                 
-                if cart_item:
+                if not added:
                     # Product already in cart
                     return JsonResponse({
                         'status': 'exists',
                         'message': 'Product is already in your cart',
-                        'cart_count': CartItem.objects.filter(cart__user=request.user).count()
+                        'cart_count': totals['item_count'],
+                        'total': str(totals['total'])
                     })
                 
-                # Create or get cart
-                cart, created = Cart.objects.get_or_create(user=request.user)
-                
-                # Create cart item
-                CartItem.objects.create(
-                    cart=cart,
-                    product=product,
-                    quantity=quantity
-                )
-                
-                cart_count = CartItem.objects.filter(cart__user=request.user).count()
+                cart_count = totals['item_count']
+                cart_total = totals['total']
             else:
                 # Handle anonymous user
-                cart = request.session.get('cart', {})
+                cart = get_session_quantities(request)
                 
-                if str(product_id) in cart:
+                if product.id in cart:
                     # Product already in cart
                     return JsonResponse({
                         'status': 'exists',
                         'message': 'Product is already in your cart',
-                        'cart_count': len(cart)
+                        'cart_count': sum(cart.values())
                     })
                 
-                cart[str(product_id)] = {
-                    'quantity': quantity,
-                    'price': str(product.price)
-                }
-                request.session['cart'] = cart
-                cart_count = len(cart)
+                cart[product.id] = int(quantity)
+                save_session_cart(request, cart)
+                session_cart = get_session_cart(request)
+                cart_count = session_cart.count
+                cart_total = session_cart.total
             
             return JsonResponse({
                 'status': 'success',
                 'message': 'Product added to cart successfully',
-                'cart_count': cart_count
+                'cart_count': cart_count,
+                'total': str(cart_total)
             })
             
         except Exception as e:
@@ -229,48 +278,42 @@ def cart_update(request):
                 quantity = int(request.POST.get('quantity', 1))
             
             if request.user.is_authenticated:
-                cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-                cart_item.quantity = quantity
-                cart_item.save()
+                carts = Cart.objects.filter(user=request.user)
+                with transaction.atomic():
+                    cost = carts.update_item(item_id, quantity)
+                    if cost is None:
+                        return JsonResponse({'success': False, 'message': 'Item not found in cart'}, status=404)
+                    totals = carts.totals()
                 
                 return JsonResponse({
                     'success': True,
-                    'cart_count': cart_item.cart.items.count(),
-                    'total': str(cart_item.cart.get_total()),
-                    'subtotal': str(cart_item.get_cost())
+                    'cart_count': totals['item_count'],
+                    'total': str(totals['total']),
+                    'subtotal': str(cost)
                 })
             else:
                 # Handle anonymous users
-                cart = request.session.get('cart', {})
-                if not isinstance(cart, dict):
-                    cart = {}
+                cart = get_session_quantities(request)
                 
                 # Use product_id for non-logged-in users
-                if product_id:
-                    cart[str(product_id)] = {
-                        'quantity': quantity,
-                        'price': str(Product.objects.get(id=product_id).price)
-                    }
-                else:
+                if not str(product_id or '').isdigit():
                     return JsonResponse({'success': False, 'message': 'Product ID is required'}, status=400)
                 
-                request.session['cart'] = cart
-                request.session.modified = True
+                # Leave the session untouched when nothing changed, so it is not written back
+                if cart.get(int(product_id)) != quantity:
+                    if not Product.objects.filter(pk=product_id).exists():
+                        return JsonResponse({'success': False, 'message': 'Product not found'}, status=404)
+                    cart[int(product_id)] = quantity
+                    save_session_cart(request, cart)
                 
                 # Calculate totals
-                total = Decimal('0')
-                for product_id, item_data in cart.items():
-                    try:
-                        product = Product.objects.get(id=product_id)
-                        total += product.price * Decimal(item_data['quantity'])
-                    except Product.DoesNotExist:
-                        continue
+                session_cart = get_session_cart(request)
                 
                 return JsonResponse({
                     'success': True,
-                    'cart_count': sum(int(item['quantity']) for item in cart.values()),
-                    'total': str(total),
-                    'subtotal': str(total)
+                    'cart_count': session_cart.count,
+                    'total': str(session_cart.total),
+                    'subtotal': str(session_cart.total)
                 })
                 
         except json.JSONDecodeError:
@@ -297,40 +340,33 @@ def cart_remove(request):
                 product_id = request.POST.get('product_id')
             
             if request.user.is_authenticated:
-                cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-                cart = cart_item.cart
-                cart_item.delete()
+                carts = Cart.objects.filter(user=request.user)
+                with transaction.atomic():
+                    if not carts.remove_item(item_id=item_id):
+                        return JsonResponse({'success': False, 'message': 'Item not found in cart'}, status=404)
+                    totals = carts.totals()
                 
                 return JsonResponse({
                     'success': True,
-                    'cart_count': cart.items.count(),
-                    'total': str(cart.get_total())
+                    'cart_count': totals['item_count'],
+                    'total': str(totals['total'])
                 })
             else:
                 # Handle anonymous users
-                cart = request.session.get('cart', {})
-                if not isinstance(cart, dict):
-                    cart = {}
+                cart = get_session_quantities(request)
                 
                 # Use product_id for non-logged-in users
-                if product_id and str(product_id) in cart:
-                    del cart[str(product_id)]
-                    request.session['cart'] = cart
-                    request.session.modified = True
+                if str(product_id or '').isdigit() and int(product_id) in cart:
+                    del cart[int(product_id)]
+                    save_session_cart(request, cart)
                     
                     # Calculate total
-                    total = Decimal('0')
-                    for pid, item_data in cart.items():
-                        try:
-                            product = Product.objects.get(id=pid)
-                            total += product.price * Decimal(item_data['quantity'])
-                        except Product.DoesNotExist:
-                            continue
+                    session_cart = get_session_cart(request)
                     
                     return JsonResponse({
                         'success': True,
-                        'cart_count': sum(int(item['quantity']) for item in cart.values()),
-                        'total': str(total)
+                        'cart_count': session_cart.count,
+                        'total': str(session_cart.total)
                     })
                 else:
                     return JsonResponse({'success': False, 'message': 'Item not found in cart'}, status=404)
@@ -342,36 +378,43 @@ def cart_remove(request):
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'}, status=405)
 
+@require_POST
+def cart_batch(request):
+    """
+    Apply several add/update/remove operations in one request.
+
+    Body: ``{"operations": [{"op": "update", "product_id": 3, "quantity": 2}, ...]}``.
+    Everything is applied in one transaction and the response carries a
+    single recomputed cart summary, for both account and guest carts.
+    """
+    try:
+        operations = parse_cart_operations(json.loads(request.body).get('operations'))
+        if request.user.is_authenticated:
+            summary = batch_update_cart(request.user, operations)
+        else:
+            summary = batch_update_session_cart(request, operations)
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Invalid JSON data'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    return JsonResponse({'success': True, **summary})
+
 def cart(request):
     logger.debug("Accessing cart view")
     if request.user.is_authenticated:
         # Handle authenticated users
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        logger.debug(f"Authenticated user cart - Items: {cart.items.count()}")
+        # Viewing an empty cart does not create one; the first add does
+        cart = Cart.objects.filter(user=request.user).first()
+        logger.debug(f"Authenticated user cart - Items: {cart.item_count if cart else 0}")
     else:
         # Handle anonymous users
         cart = None
-        cart_items = []
-        total = 0
-        session_cart = request.session.get('cart', {})
-        logger.debug(f"Session cart contents: {session_cart}")
+        session_cart = get_session_cart(request)
+        logger.debug(f"Session cart contents: {session_cart.data}")
         
-        if isinstance(session_cart, dict):
-            for product_id, quantity in session_cart.items():
-                try:
-                    product = Product.objects.get(id=product_id)
-                    # Ensure quantity is an integer
-                    quantity = int(quantity) if isinstance(quantity, (int, str)) else 1
-                    subtotal = product.price * quantity
-                    cart_items.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'subtotal': subtotal
-                    })
-                    total += subtotal
-                except Product.DoesNotExist:
-                    logger.error(f"Product not found: {product_id}")
-                    continue
+        # Shares the memoized lookup with the cart context processor
+        cart_items = session_cart.items
+        total = session_cart.total
         
         logger.debug(f"Anonymous user cart - Items: {len(cart_items)}, Total: {total}")
     
@@ -384,23 +427,17 @@ def cart(request):
 
 @login_required
 def checkout(request):
-    cart = Cart.objects.get(user=request.user)
-    if cart.items.count() == 0:
-        return redirect('cart')
+    cart = Cart.objects.filter(user=request.user).first()
+    # Check the lines themselves rather than trusting the stored count
+    if cart is None or not cart.items.exists():
+        return redirect('mainapp:cart')
         
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
             try:
-                # Calculate totals
-                subtotal = cart.get_subtotal()
-                discount = cart.get_discount()
-                shipping_cost = Decimal('10.00')  # Example shipping cost
-                total = subtotal - discount + shipping_cost
-                
-                # Create order
-                order = Order.objects.create(
-                    user=request.user,
+                order = OrderPlacementService().place_order(
+                    cart,
                     first_name=form.cleaned_data['first_name'],
                     last_name=form.cleaned_data['last_name'],
                     email=form.cleaned_data['email'],
@@ -409,27 +446,9 @@ def checkout(request):
                     postal_code=form.cleaned_data['postal_code'],
                     city=form.cleaned_data['city'],
                     country=form.cleaned_data['country'],
-                    payment_method=form.cleaned_data['payment_method'],
-                    total=total,
-                    subtotal=subtotal,
-                    discount=discount,
-                    shipping_cost=shipping_cost
+                    payment_method=form.cleaned_data['payment_method']
                 )
                 
-                # Add items to order
-                for item in cart.items.all():
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item.product,
-                        price=item.product.price,
-                        quantity=item.quantity
-                    )
-                
-                # Clear the cart
-                cart.items.all().delete()
-                cart.coupon = None
-                cart.save()
-                
                 # Handle payment based on selected method
                 payment_method = form.cleaned_data['payment_method']
                 if payment_method == 'telebirr':
@@ -561,7 +580,7 @@ def apply_coupon(request):
                 'discount_amount': str(discount),
                 'subtotal': str(subtotal),
                 'cart_total': str(total),
-                'cart_count': cart.items.count()
+                'cart_count': cart.item_count
             })
             
         except Coupon.DoesNotExist:
@@ -582,7 +601,12 @@ def apply_coupon(request):
 
 @login_required
 def order_list(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    # Newest first, keyset-paginated along order_user_created_idx
+    paginator = KeysetPaginator(Order.objects.filter(user=request.user), ['-created_at'], ORDERS_PER_PAGE)
+    orders = paginator.get_page(request.GET.get('cursor'))
+    # Orders show their stored items_summary; only older rows without one
+    # (see reconcile_order_summaries) need their items
+    prefetch_related_objects([order for order in orders if not order.items_summary], 'items__product')
     return render(request, 'mainapp/order_list.html', {'orders': orders})
 
 @login_required
@@ -601,12 +625,6 @@ def paypal_payment(request, order_id):
             messages.error(request, 'Payment system is not properly configured. Please contact support.')
             return redirect('mainapp:order_detail', order_id=order.id)
         
-        paypalrestsdk.configure({
-            "mode": settings.PAYPAL_MODE,
-            "client_id": settings.PAYPAL_CLIENT_ID,
-            "client_secret": settings.PAYPAL_SECRET_KEY
-        })
-        
         payment = paypalrestsdk.Payment({
             "intent": "sale",
             "payer": {"payment_method": "paypal"},
@@ -621,7 +639,7 @@ def paypal_payment(request, order_id):
                 },
                 "description": f"Order #{order.id}"
             }]
-        })
+        }, api=get_paypal_api())
         
         if payment.create():
             for link in payment.links:
@@ -648,7 +666,7 @@ def telebirr_payment(request, order_id):
             return redirect('mainapp:order_detail', order_id=order.id)
         
         # Initialize payment service
-        payment_service = TelebirrPaymentService()
+        payment_service = get_telebirr_service()
         
         # Create payment request
         result = payment_service.create_payment(
@@ -712,15 +730,14 @@ def rate_product(request, product_id):
                 ).exists()
             )
         
-        # Calculate new average rating
-        avg_rating = product.reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
-        review_count = product.reviews.count()
+        # Read the aggregates updated by the review signal handlers
+        product.refresh_from_db(fields=['rating_avg', 'rating_count'])
         
         return JsonResponse({
             'status': 'success',
             'message': 'Rating submitted successfully',
-            'avg_rating': round(avg_rating, 1),
-            'review_count': review_count
+            'avg_rating': float(round(product.rating_avg, 1)),
+            'review_count': product.rating_count
         })
         
     except Exception as e:
@@ -775,8 +792,10 @@ def newsletter_subscribe(request):
 def cart_clear(request):
     if request.method == 'POST':
         try:
-            cart = Cart.objects.get(user=request.user)
-            cart.items.all().delete()
+            # Carts are only created on the first add, so there may be nothing to clear
+            cart = Cart.objects.filter(user=request.user).first()
+            if cart is not None:
+                cart.clear()
             
             return JsonResponse({
                 'status': 'success',
@@ -784,11 +803,6 @@ def cart_clear(request):
                 'cart_count': 0,
                 'cart_total': '0.00'
             })
-        except Cart.DoesNotExist:
-            return JsonResponse({
-                'status': 'error',
-                'message': 'Cart not found'
-            }, status=404)
         except Exception as e:
             logger.error(f"Error clearing cart: {str(e)}")
             return JsonResponse({
@@ -811,18 +825,14 @@ def search_products(request):
     category_slug = request.GET.get('category')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
-    sort_by = request.GET.get('sort', 'name')
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'name')
     
     # Start with all available products
     products = Product.objects.filter(available=True)
     
     # Apply search query filter if provided
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
+        products = get_search_backend().search(products, search_query)
     
     # Apply category filter if provided
     if category_slug:
@@ -851,20 +861,21 @@ def search_products(request):
         products = products.order_by('-price')
     elif sort_by == 'newest':
         products = products.order_by('-created_at')
+    elif sort_by == 'relevance' and search_query:
+        products = products.order_by('-search_rank', 'name')
     else:  # Default to name
         products = products.order_by('name')
     
     # Paginate results
-    paginator = Paginator(products, 12)  # Show 12 products per page
-    page_number = request.GET.get('page', 1)
-    products = paginator.get_page(page_number)
+    products = paginate_products(request, products, sort_by)
     
     # Get all categories for filter sidebar
-    categories = Category.objects.all()
+    categories = sidebar_categories()
     
     # Prepare context
     context = {
         'products': products,
+        'pagination_query': pagination_query(request),
         'categories': categories,
         'search_query': search_query,
         'current_category': category_slug,
@@ -1110,17 +1121,12 @@ def delete_product(request, product_id):
 @login_required
 def conversations(request):
     """View function for listing user's conversations."""
-    conversations = Conversation.objects.filter(
-        Q(seller=request.user) | Q(buyer=request.user)
-    ).order_by('-last_message_at')
+    conversations = list(Conversation.objects.for_user(request.user).select_related(
+        'product', 'buyer', 'seller', 'last_message'
+    ).order_by(F('last_message_at').desc(nulls_last=True), '-updated_at'))
     
-    # Get unread message counts for each conversation
     for conversation in conversations:
-        conversation.unread_count = Message.objects.filter(
-            conversation=conversation,
-            recipient=request.user,
-            is_read=False
-        ).count()
+        conversation.counterparty = conversation.other_party(request.user)
     
     return render(request, 'mainapp/conversations.html', {'conversations': conversations})
 
@@ -1128,19 +1134,14 @@ def conversations(request):
 def conversation_detail(request, conversation_id):
     """View function for viewing a conversation."""
     conversation = get_object_or_404(
-        Conversation,
+        Conversation.objects.select_related('product', 'buyer', 'seller'),
         Q(seller=request.user) | Q(buyer=request.user),
         id=conversation_id
     )
     
-    # Mark messages as read
-    Message.objects.filter(
-        conversation=conversation,
-        recipient=request.user,
-        is_read=False
-    ).update(is_read=True)
-    
-    messages = Message.objects.filter(conversation=conversation).order_by('created_at')
+    # Mark messages as read; the stored counter tells us whether there is anything to update
+    if conversation.unread_for(request.user) and conversation.mark_read(request.user):
+        transaction.on_commit(partial(publish_unread_count, request.user.pk))
     
     if request.method == 'POST':
         content = request.POST.get('content')
@@ -1148,16 +1149,66 @@ def conversation_detail(request, conversation_id):
             Message.objects.create(
                 conversation=conversation,
                 sender=request.user,
-                recipient=conversation.seller if request.user == conversation.buyer else conversation.buyer,
+                recipient_id=conversation.recipient_for(request.user.pk),
                 content=content
             )
-            conversation.last_message_at = timezone.now()
-            conversation.save()
             return redirect('mainapp:conversation_detail', conversation_id=conversation.id)
     
+    page = message_paginator(conversation).get_page()
     return render(request, 'mainapp/conversation_detail.html', {
         'conversation': conversation,
-        'messages': messages
+        'messages': list(reversed(page.object_list)),
+        'older_cursor': page.next_cursor,
+    })
+
+MESSAGES_PER_PAGE = 30
+
+def message_paginator(conversation):
+    """Newest-first keyset pagination over a conversation's messages."""
+    return KeysetPaginator(
+        Message.objects.filter(conversation=conversation).select_related('sender'),
+        ['-created_at'],
+        MESSAGES_PER_PAGE
+    )
+
+def get_user_conversation(request, conversation_id):
+    return get_object_or_404(
+        Conversation,
+        Q(seller=request.user) | Q(buyer=request.user),
+        id=conversation_id
+    )
+
+@login_required
+def conversation_messages_older(request, conversation_id):
+    """JSON page of messages older than ``?cursor=``, oldest first."""
+    conversation = get_user_conversation(request, conversation_id)
+    page = message_paginator(conversation).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'messages': [message_payload(message) for message in reversed(page.object_list)],
+        'older_cursor': page.next_cursor,
+    })
+
+@login_required
+def conversation_messages_since(request, conversation_id):
+    """JSON list of messages newer than ``?after=<message id>``, oldest first."""
+    conversation = get_user_conversation(request, conversation_id)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid message id'}, status=400)
+    
+    messages = list(Message.objects.filter(
+        conversation=conversation, pk__gt=after
+    ).select_related('sender').order_by('pk')[:MESSAGES_PER_PAGE + 1])
+    has_more = len(messages) > MESSAGES_PER_PAGE
+    messages = messages[:MESSAGES_PER_PAGE]
+    
+    if messages and conversation.unread_for(request.user) and conversation.mark_read(request.user):
+        transaction.on_commit(partial(publish_unread_count, request.user.pk))
+    
+    return JsonResponse({
+        'messages': [message_payload(message) for message in messages],
+        'has_more': has_more,
     })
 
 @login_required
@@ -1195,13 +1246,41 @@ def start_conversation(request, product_id):
 @login_required
 def get_unread_message_count(request):
     """View function for getting the count of unread messages."""
-    count = Message.objects.filter(
-        recipient=request.user,
-        is_read=False
-    ).count()
+    count = Conversation.objects.unread_total(request.user)
     
     return JsonResponse({'count': count})
 
+async def message_stream(request):
+    """
+    Server-Sent Events stream of the user's unread count and new messages.
+
+    Sends the current unread count on connect, then only forwards events
+    published by Message saves and reads, so an idle tab runs no queries.
+    """
+    if not stream_supported(request):
+        # Pages poll api/unread-messages/ instead; see base.html
+        return HttpResponse(status=404)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    async def events():
+        async with get_broker().subscribe(user_channel(user.pk)) as subscription:
+            count = await sync_to_async(Conversation.objects.unread_total)(user)
+            yield format_event({'type': 'unread', 'count': count})
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), settings.NOTIFICATIONS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(event)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def signup(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
@@ -1229,7 +1308,7 @@ def initiate_payment(request, order_id):
             return redirect('order_detail', order_id=order.id)
         
         # Initialize payment service
-        payment_service = TelebirrPaymentService()
+        payment_service = get_telebirr_service()
         
         # Create payment request
         result = payment_service.create_payment(
@@ -1264,24 +1343,21 @@ def payment_notify(request):
         if not transaction_id:
             return JsonResponse({'status': 'error', 'message': 'Missing transaction ID'})
         
-        # Initialize payment service
-        payment_service = TelebirrPaymentService()
-        
-        # Verify the payment
-        result = payment_service.verify_payment(transaction_id)
+        # Record the notification and acknowledge at once; process_payment_notifications
+        # verifies it with the gateway. Repeated notifications collapse onto one row.
+        PaymentNotification.objects.bulk_create(
+            [PaymentNotification(out_trade_no=str(transaction_id), payload=data)],
+            ignore_conflicts=True
+        )
+        # Anyone can call this endpoint, so a repeat only re-queues a failed row
+        # when it brings new data or the failure was retryable; attempts are
+        # kept so the worker's max_attempts still bounds gateway calls
+        PaymentNotification.objects.filter(
+            Q(retryable=True) | ~Q(payload=data),
+            out_trade_no=str(transaction_id), status='failed'
+        ).update(status='pending', payload=data, retryable=False)
         
-        if result['success']:
-            # Update order status if payment is completed
-            if result['status'] == 'completed':
-                payment = TelebirrPayment.objects.get(transaction_id=transaction_id)
-                order = payment.order
-                order.paid = True
-                order.status = 'processing'
-                order.save()
-            
-            return JsonResponse({'status': 'success'})
-        else:
-            return JsonResponse({'status': 'error', 'message': result['error']})
+        return JsonResponse({'status': 'success'})
             
     except json.JSONDecodeError:
         return JsonResponse({'status': 'error', 'message': 'Invalid JSON data'})
@@ -1300,7 +1376,7 @@ def payment_return(request):
             return redirect('mainapp:order_list')
         
         # Initialize payment service
-        payment_service = TelebirrPaymentService()
+        payment_service = get_telebirr_service()
         
         # Verify the payment
         result = payment_service.verify_payment(transaction_id)
@@ -1331,63 +1407,55 @@ def payment_return(request):
 
 @user_passes_test(lambda u: u.is_staff)
 def admin_dashboard(request):
-    # Sales Summary
-    today = timezone.now().date()
+    # Sales Summary, read from the daily rollup so the cost depends on the window, not on order volume
+    today = timezone.localdate()
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
-    
-    sales_today = Order.objects.filter(
-        created_at__date=today,
-        paid=True
-    ).aggregate(total=Sum('items__price'))['total'] or Decimal('0.00')
-    
-    sales_week = Order.objects.filter(
-        created_at__date__gte=week_ago,
-        paid=True
-    ).aggregate(total=Sum('items__price'))['total'] or Decimal('0.00')
-    
-    sales_month = Order.objects.filter(
-        created_at__date__gte=month_ago,
-        paid=True
-    ).aggregate(total=Sum('items__price'))['total'] or Decimal('0.00')
+    previous_month_ago = month_ago - timedelta(days=30)
+
+    sales = DailySalesRollup.objects.filter(date__gte=month_ago).aggregate(
+        today=Sum('gross', filter=Q(date=today)),
+        week=Sum('gross', filter=Q(date__gte=week_ago)),
+        month=Sum('gross'),
+    )
+    sales_today = sales['today'] or Decimal('0.00')
+    sales_week = sales['week'] or Decimal('0.00')
+    sales_month = sales['month'] or Decimal('0.00')
     
     # Order Status Overview
-    order_statuses = Order.objects.values('status').annotate(
+    order_statuses = list(Order.objects.values('status').annotate(
         count=Count('id')
-    ).order_by('status')
+    ).order_by('status'))
     
     total_orders = sum(status['count'] for status in order_statuses)
     for status in order_statuses:
         status['percentage'] = round((status['count'] / total_orders) * 100) if total_orders > 0 else 0
     
     # Recent Orders
-    recent_orders = Order.objects.select_related('user').prefetch_related('items').order_by('-created_at')[:10]
-    
-    # Top Selling Products
-    top_products = Product.objects.annotate(
-        sold_count=Count('orderitem__order', filter=Q(orderitem__order__paid=True)),
-        revenue=Sum('orderitem__price', filter=Q(orderitem__order__paid=True))
-    ).order_by('-sold_count')[:5]
-    
-    # Add revenue growth calculation
-    for product in top_products:
-        previous_month = Order.objects.filter(
-            items__product=product,
-            created_at__date__gte=month_ago - timedelta(days=30),
-            created_at__date__lt=month_ago,
-            paid=True
-        ).aggregate(revenue=Sum('items__price'))['revenue'] or Decimal('0.00')
-        
-        current_month = Order.objects.filter(
-            items__product=product,
-            created_at__date__gte=month_ago,
-            paid=True
-        ).aggregate(revenue=Sum('items__price'))['revenue'] or Decimal('0.00')
-        
+    recent_orders = Order.objects.select_related('user').order_by('-created_at')[:10]
+    
+    # Top Selling Products over the last 30 days, with growth against the 30 days before
+    current = Q(date__gte=month_ago)
+    product_sales = list(DailySalesRollup.objects.filter(
+        date__gte=previous_month_ago
+    ).values('product').annotate(
+        sold_count=Sum('order_count', filter=current),
+        revenue=Sum('gross', filter=current),
+        previous_month_revenue=Sum('gross', filter=~current),
+    ).filter(sold_count__gt=0).order_by('-sold_count', '-revenue')[:5])
+    products = Product.objects.in_bulk([row['product'] for row in product_sales])
+    
+    top_products = []
+    for row in product_sales:
+        product = products[row['product']]
+        product.sold_count = row['sold_count']
+        product.revenue = row['revenue']
+        previous_month = row['previous_month_revenue'] or Decimal('0.00')
         if previous_month > 0:
-            product.revenue_growth = round(((current_month - previous_month) / previous_month) * 100)
+            product.revenue_growth = round(((product.revenue - previous_month) / previous_month) * 100)
         else:
             product.revenue_growth = 0
+        top_products.append(product)
     
     # Low Stock Alerts
     low_stock_products = Product.objects.filter(stock__lte=10).order_by('stock')[:5]
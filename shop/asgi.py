@@ -3,6 +3,10 @@ ASGI config for shop project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this module (e.g. ``uvicorn shop.asgi:application``)
+so the unread-message stream at ``api/messages/stream/`` runs as an async
+view; under WSGI each open stream would hold a worker thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # Load environment variables
 load_dotenv()
@@ -79,6 +80,7 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "mainapp.context_processors.cart",
+                "mainapp.context_processors.notifications",
             ],
         },
     },
@@ -98,6 +100,82 @@ DATABASES = {
 }
 
 
+# Caches
+# The catalog cache holds rendered category/product fragments. Use "file" or
+# "redis" when running several processes so invalidation reaches all of them.
+CATALOG_CACHE_BACKEND = os.getenv('CATALOG_CACHE_BACKEND', 'locmem')
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_CACHE_PENDING_TIMEOUT = 60
+CATALOG_CACHES = {
+    'locmem': {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "catalog",
+    },
+    'file': {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, 'cache', 'catalog'),
+    },
+    'redis': {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+# Sessions live in django_session unless a shared cache is configured. With
+# SESSION_CACHE_BACKEND=redis they are read from the "sessions" cache first
+# (cached_db, which still writes each change through); SESSION_ENGINE=
+# django.contrib.sessions.backends.cache also keeps the writes out of the
+# database. A per-process locmem session cache serves stale sessions (e.g.
+# after a logout) to the other workers, so it is refused outside DEBUG.
+SESSION_CACHE_BACKEND = os.getenv('SESSION_CACHE_BACKEND', 'locmem')
+SESSION_CACHES = {
+    'locmem': {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "sessions",
+    },
+    'redis': {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+        "KEY_PREFIX": "sessions",
+    },
+}
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', (
+    'django.contrib.sessions.backends.db' if SESSION_CACHE_BACKEND == 'locmem'
+    else 'django.contrib.sessions.backends.cached_db'
+))
+if (not DEBUG and SESSION_CACHE_BACKEND == 'locmem'
+        and SESSION_ENGINE.rsplit('.', 1)[-1] in ('cache', 'cached_db')):
+    raise ImproperlyConfigured(
+        f'{SESSION_ENGINE} needs a cache shared by all workers; set SESSION_CACHE_BACKEND=redis'
+    )
+SESSION_CACHE_ALIAS = 'sessions'
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalog": CATALOG_CACHES[CATALOG_CACHE_BACKEND],
+    "sessions": SESSION_CACHES[SESSION_CACHE_BACKEND],
+}
+
+# How a guest cart is merged into the account cart on login when both hold
+# the same product: "sum", "max", "guest" (guest quantity wins) or "account"
+CART_MERGE_POLICY = 'sum'
+
+# Show an approximate result count on keyset-paginated product listings
+PRODUCT_LIST_APPROXIMATE_COUNT = False
+
+# Product search backend (dotted path); picked from the database engine when None
+SEARCH_BACKEND = None
+
+# Unread-message notifications streamed to the browser (needs an ASGI server).
+# The in-process broker only reaches tabs served by the same process; use
+# "mainapp.notifications.RedisBroker" when running several workers.
+NOTIFICATIONS_BROKER = os.getenv('NOTIFICATIONS_BROKER', 'mainapp.notifications.InProcessBroker')
+NOTIFICATIONS_REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1')
+NOTIFICATIONS_KEEPALIVE = 25
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -130,10 +208,45 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# `python manage.py build_assets` vendors the CDN libraries into static/vendor/
+# and runs collectstatic. Outside DEBUG, collected files are fingerprinted via
+# the manifest and get .gz (and .br with `pip install brotli`) siblings, which
+# shop.urls serves with far-future cache headers.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+            else "mainapp.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+
+# Link a vendored library from its upstream CDN while build_assets has not
+# downloaded it yet. Development only: with this off a missing file raises,
+# and `manage.py check --deploy` lists them (mainapp.E001).
+VENDOR_ASSET_CDN_FALLBACK = DEBUG
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Responsive variants of uploaded images (see mainapp.images). Never generated
+# in the upload request: with IMAGE_VARIANT_WORKERS = 0 (the default) uploads
+# are queued and "manage.py generate_image_variants --pending --loop" must run
+# alongside the web processes; > 0 hands them to a pool of that many processes,
+# started on first use. Either way the work happens in another process, which
+# publishes manifests and invalidates catalog fragments through the catalog
+# cache, so use a shared CATALOG_CACHE_BACKEND (file/redis). With locmem,
+# fragments still showing original images expire after
+# CATALOG_CACHE_PENDING_TIMEOUT seconds instead.
+# Formats the installed Pillow cannot encode are skipped.
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1024)
+IMAGE_VARIANT_FORMATS = ('avif', 'webp', 'jpeg')
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 0))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -147,6 +260,11 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 PAYPAL_CLIENT_ID = os.getenv('PAYPAL_CLIENT_ID', '')
 PAYPAL_SECRET_KEY = os.getenv('PAYPAL_SECRET_KEY', '')
 PAYPAL_MODE = 'sandbox'  # Change to 'live' in production
+# Override the REST endpoint, e.g. to point at the mock_paypal_api stub
+PAYPAL_API_ENDPOINT = os.getenv('PAYPAL_API_ENDPOINT', '')
+PAYPAL_CONNECT_TIMEOUT = 3.05
+PAYPAL_READ_TIMEOUT = 15
+PAYPAL_POOL_SIZE = 10
 
 # Check if PayPal credentials are configured
 PAYPAL_CONFIGURED = bool(PAYPAL_CLIENT_ID and PAYPAL_SECRET_KEY)
@@ -154,7 +272,7 @@ PAYPAL_CONFIGURED = bool(PAYPAL_CLIENT_ID and PAYPAL_SECRET_KEY)
 # Telebirr Settings (mock credentials)
 
 # Telebirr Payment Settings
-TELEBIRR_API_URL = 'http://127.0.0.1:8000/apiaccess/payment/gateway'  # Replace with actual API URL
+TELEBIRR_API_URL = os.getenv('TELEBIRR_API_URL', 'http://127.0.0.1:8000/apiaccess/payment/gateway')  # Replace with actual API URL
 TELEBIRR_APP_KEY = 'MIIEvgIBADANBgkqhkiG9w0BAQEFAASCBKgwggSkAgEAAoIBAQC/ZcoOng1sJZ4CegopQVCw3HYqqVRLEudgT+dDpS8fRVy7zBgqZunju2VRCQuHeWs7yWgc9QGd4/8kRSLY+jlvKNeZ60yWcqEY+eKyQMmcjOz2Sn41fcVNgF+HV3DGiV4b23B6BCMjnpEFIb9d99/TsjsFSc7gCPgfl2yWDxE/Y1B2tVE6op2qd63YsMVFQGdre/CQYvFJENpQaBLMq4hHyBDgluUXlF0uA1X7UM0ZjbFC6ZIB/Hn1+pl5Ua8dKYrkVaecolmJT/s7c/+/1JeN+ja8luBoONsoODt2mTeVJHLF9Y3oh5rI+IY8HukIZJ1U6O7/JcjH3aRJTZagXUS9AgMBAAECggEBALBIBx8JcWFfEDZFwuAWeUQ7+VX3mVx/770kOuNx24HYt718D/HV0avfKETHqOfA7AQnz42EF1Yd7Rux1ZO0e3unSVRJhMO4linT1XjJ9ScMISAColWQHk3wY4va/FLPqG7N4L1w3BBtdjIc0A2zRGLNcFDBlxl/CVDHfcqD3CXdLukm/friX6TvnrbTyfAFicYgu0+UtDvfxTL3pRL3u3WTkDvnFK5YXhoazLctNOFrNiiIpCW6dJ7WRYRXuXhz7C0rENHyBtJ0zura1WD5oDbRZ8ON4v1KV4QofWiTFXJpbDgZdEeJJmFmt5HIi+Ny3P5n31WwZpRMHGeHrV23//0CgYEA+2/gYjYWOW3JgMDLX7r8fGPTo1ljkOUHuH98H/a/lE3wnnKKx+2ngRNZX4RfvNG4LLeWTz9plxR2RAqqOTbX8fj/NA/sS4mru9zvzMY1925FcX3WsWKBgKlLryl0vPScq4ejMLSCmypGz4VgLMYZqT4NYIkU2Lo1G1MiDoLy0CcCgYEAwt77exynUhM7AlyjhAA2wSINXLKsdFFF1u976x9kVhOfmbAutfMJPEQWb2WXaOJQMvMpgg2rU5aVsyEcuHsRH/2zatrxrGqLqgxaiqPz4ELINIh1iYK/hdRpr1vATHoebOv1wt8/9qxITNKtQTgQbqYci3KV1lPsOrBAB5S57nsCgYAvw+cagS/jpQmcngOEoh8I+mXgKEET64517DIGWHe4kr3dO+FFbc5eZPCbhqgxVJ3qUM4LK/7BJq/46RXBXLvVSfohR80Z5INtYuFjQ1xJLveeQcuhUxdK+95W3kdBBi8lHtVPkVsmYvekwK+ukcuaLSGZbzE4otcn47kajKHYDQKBgDbQyIbJ+ZsRw8CXVHu2H7DWJlIUBIS3s+CQ/xeVfgDkhjmSIKGX2to0AOeW+S9MseiTE/L8a1wY+MUppE2UeK26DLUbH24zjlPoI7PqCJjl0DFOzVlACSXZKV1lfsNEeriC61/EstZtgezyOkAlSCIH4fGr6tAeTU349Bnt0RtvAoGBAObgxjeH6JGpdLz1BbMj8xUHuYQkbxNeIPhH29CySn0vfhwg9VxAtIoOhvZeCfnsCRTj9OZjepCeUqDiDSoFznglrKhfeKUndHjvg+9kiae92iI6qJudPCHMNwP8wMSphkxUqnXFR3lr9A765GA980818UWZdrhrjLKtIIZdh+X1'  # Replace with your actual app key
 TELEBIRR_PUBLIC_KEY = '''-----BEGIN PUBLIC KEY-----
 Your public key here
@@ -163,6 +281,16 @@ TELEBIRR_RECEIVE_NAME = 'Gebeya'  # Replace with your company name
 TELEBIRR_NOTIFY_URL = 'http://127.0.0.1:8000//payment/notify/'  # Replace with your actual notify URL
 TELEBIRR_RETURN_URL = 'http://127.0.0.1:8000//payment/return/'  # Replace with your actual return URL
 
+# Telebirr gateway client: pooled connections, bounded timeouts (seconds),
+# jittered retries and a circuit breaker that fails fast while the gateway is down
+TELEBIRR_CONNECT_TIMEOUT = 3.05
+TELEBIRR_READ_TIMEOUT = 10
+TELEBIRR_MAX_RETRIES = 2
+TELEBIRR_RETRY_BACKOFF = 0.3
+TELEBIRR_POOL_SIZE = 10
+TELEBIRR_CIRCUIT_FAILURES = 5
+TELEBIRR_CIRCUIT_RESET = 30
+
 # Authentication settings
 AUTH_USER_MODEL = 'mainapp.CustomUser'
 AUTHENTICATION_BACKENDS = [
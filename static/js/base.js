@@ -0,0 +1,191 @@
+// Get CSRF token from cookies
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Toast notification system
+function showToast(title, message, type = 'success') {
+    const toastContainer = document.querySelector('.toast-container');
+    if (!toastContainer) return;
+
+    // Remove existing toasts
+    toastContainer.querySelectorAll('.toast').forEach(t => t.remove());
+
+    const toast = document.createElement('div');
+    toast.className = `toast align-items-center text-white bg-${type} border-0`;
+    toast.setAttribute('role', 'alert');
+    toast.setAttribute('aria-live', 'assertive');
+    toast.setAttribute('aria-atomic', 'true');
+
+    toast.innerHTML = `
+        <div class="d-flex">
+            <div class="toast-body">
+                <strong>${title}</strong><br>
+                ${message}
+            </div>
+            <button type="button" class="btn-close btn-close-white me-2 m-auto" data-bs-dismiss="toast"></button>
+        </div>
+    `;
+
+    toastContainer.appendChild(toast);
+    const bsToast = new bootstrap.Toast(toast, {
+        autohide: true,
+        delay: 3000
+    });
+    bsToast.show();
+
+    toast.addEventListener('hidden.bs.toast', () => {
+        toast.remove();
+    });
+}
+
+// Update cart badge
+function updateCartBadge(count) {
+    const cartBadge = document.querySelector('.cart-badge');
+    if (cartBadge) {
+        cartBadge.textContent = count;
+        cartBadge.style.display = count > 0 ? 'block' : 'none';
+    }
+}
+
+// Send several cart changes in one request:
+// cartBatch([{op: 'update', product_id: 3, quantity: 2}, {op: 'remove', product_id: 5}])
+// resolves with the recomputed cart summary.
+function cartBatch(operations) {
+    return fetch(document.body.dataset.cartBatchUrl, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken')
+        },
+        body: JSON.stringify({ operations: operations })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) throw new Error(data.message || 'Cart update failed');
+        updateCartBadge(data.cart_count);
+        return data;
+    });
+}
+
+// Initialize tooltips and popovers
+document.addEventListener('DOMContentLoaded', function() {
+    // Initialize tooltips
+    var tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'))
+    tooltipTriggerList.map(function (tooltipTriggerEl) {
+        return new bootstrap.Tooltip(tooltipTriggerEl)
+    });
+
+    // Initialize popovers
+    var popoverTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="popover"]'))
+    popoverTriggerList.map(function (popoverTriggerEl) {
+        return new bootstrap.Popover(popoverTriggerEl)
+    });
+
+    // Add fade-in animation to elements
+    const elements = document.querySelectorAll('.fade-in');
+    elements.forEach(element => {
+        element.style.opacity = '0';
+        setTimeout(() => {
+            element.style.opacity = '1';
+        }, 100);
+    });
+
+    // Update cart badge visibility
+    const cartBadge = document.querySelector('.cart-badge');
+    if (cartBadge) {
+        const count = parseInt(cartBadge.textContent);
+        cartBadge.style.display = count > 0 ? 'block' : 'none';
+    }
+
+    // Handle search form
+    const searchForm = document.querySelector('.search-form');
+    if (searchForm) {
+        searchForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            const searchInput = this.querySelector('input[name="q"]');
+            if (searchInput.value.trim()) {
+                window.location.href = `${document.body.dataset.productListUrl}?q=${encodeURIComponent(searchInput.value.trim())}`;
+            }
+        });
+    }
+});
+
+// Mobile Search Toggle
+document.addEventListener('DOMContentLoaded', function() {
+    const searchToggle = document.querySelector('.search-toggle');
+    const searchPopup = document.querySelector('.search-popup');
+
+    if (searchToggle && searchPopup) {
+        searchToggle.addEventListener('click', function() {
+            searchPopup.classList.toggle('active');
+            searchToggle.classList.toggle('active');
+
+            if (searchPopup.classList.contains('active')) {
+                const input = searchPopup.querySelector('input');
+                if (input) input.focus();
+            }
+        });
+
+        // Close search when clicking outside
+        document.addEventListener('click', function(e) {
+            if (!searchToggle.contains(e.target) && !searchPopup.contains(e.target)) {
+                searchPopup.classList.remove('active');
+                searchToggle.classList.remove('active');
+            }
+        });
+    }
+});
+
+function updateUnreadBadges(count) {
+    document.querySelectorAll('.unread-badge').forEach(function(badge) {
+        badge.textContent = count;
+        badge.style.display = count > 0 ? 'inline-block' : 'none';
+    });
+}
+
+// Under ASGI the unread count and new messages are pushed by the server and
+// nothing polls. The stream URL is only set on <body> for signed-in users.
+if (window.EventSource && document.body.dataset.messageStreamUrl) {
+    const messageStream = new EventSource(document.body.dataset.messageStreamUrl);
+    messageStream.addEventListener('unread', function(e) {
+        updateUnreadBadges(JSON.parse(e.data).count);
+    });
+    messageStream.addEventListener('message', function(e) {
+        document.dispatchEvent(new CustomEvent('chat:message', { detail: JSON.parse(e.data) }));
+    });
+    let streamOpened = false;
+    messageStream.addEventListener('open', function() {
+        if (streamOpened) document.dispatchEvent(new CustomEvent('chat:reconnected'));
+        streamOpened = true;
+    });
+}
+
+// Served over WSGI: poll the unread count instead, while the tab is visible.
+// Pages showing a conversation fetch what they missed on each poll.
+const UNREAD_POLL_INTERVAL = 30000;
+if (document.body.dataset.unreadCountUrl) {
+    function pollUnread() {
+        if (document.hidden) return;
+        fetch(document.body.dataset.unreadCountUrl)
+            .then(response => response.json())
+            .then(data => {
+                updateUnreadBadges(data.count);
+                document.dispatchEvent(new CustomEvent('chat:poll'));
+            })
+            .catch(error => console.error('Error:', error));
+    }
+    pollUnread();
+    setInterval(pollUnread, UNREAD_POLL_INTERVAL);
+}